@@ -0,0 +1,32 @@
+"""token versions and revocations
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-17 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('users', sa.Column('token_version', sa.Integer(), server_default='0', nullable=False))
+    op.create_table(
+        'token_revocations',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('min_token_version', sa.Integer(), nullable=False),
+        sa.Column('revoked_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+        sa.PrimaryKeyConstraint('user_id')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('token_revocations')
+    op.drop_column('users', 'token_version')
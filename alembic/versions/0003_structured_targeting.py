@@ -0,0 +1,79 @@
+"""structured targeting rules
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-17 11:00:00.000000
+
+"""
+import json
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+
+def _to_rules(raw):
+    # Mirrors schemas.Targeting's handling of the legacy free-form strings
+    try:
+        targeting = json.loads(raw)
+    except ValueError:
+        targeting = {"groups": [raw]}
+    if not isinstance(targeting, dict):
+        return None
+    if "rules" in targeting:
+        return targeting
+    groups = targeting.get("groups")
+    if not groups:
+        return None
+    if isinstance(groups, str):
+        groups = [groups]
+    return {"rules": [{"type": "group", "groups": [str(group) for group in groups]}]}
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    rows = bind.execute(sa.text(
+        "SELECT id, user_group_targeting FROM feature_flags WHERE user_group_targeting IS NOT NULL"
+    )).all()
+    for flag_id, raw in rows:
+        rules = _to_rules(raw)
+        bind.execute(
+            sa.text("UPDATE feature_flags SET user_group_targeting = :value WHERE id = :id"),
+            {"value": json.dumps(rules) if rules is not None else None, "id": flag_id}
+        )
+
+    with op.batch_alter_table('feature_flags') as batch_op:
+        batch_op.alter_column(
+            'user_group_targeting',
+            existing_type=sa.String(),
+            type_=sa.JSON().with_variant(postgresql.JSONB(), 'postgresql'),
+            postgresql_using='user_group_targeting::jsonb'
+        )
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('feature_flags') as batch_op:
+        batch_op.alter_column(
+            'user_group_targeting',
+            existing_type=sa.JSON().with_variant(postgresql.JSONB(), 'postgresql'),
+            type_=sa.String(),
+            postgresql_using='user_group_targeting::text'
+        )
+
+    bind = op.get_bind()
+    rows = bind.execute(sa.text(
+        "SELECT id, user_group_targeting FROM feature_flags WHERE user_group_targeting IS NOT NULL"
+    )).all()
+    for flag_id, raw in rows:
+        rules = json.loads(raw).get("rules") or []
+        if len(rules) == 1 and rules[0].get("type") == "group":
+            bind.execute(
+                sa.text("UPDATE feature_flags SET user_group_targeting = :value WHERE id = :id"),
+                {"value": json.dumps({"groups": rules[0]["groups"]}), "id": flag_id}
+            )
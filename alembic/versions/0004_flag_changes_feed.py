@@ -0,0 +1,57 @@
+"""flag changes feed
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # updated_at becomes the changes-feed watermark, so it must be set on insert too
+    op.execute("UPDATE feature_flags SET updated_at = created_at WHERE updated_at IS NULL")
+    with op.batch_alter_table('feature_flags') as batch_op:
+        batch_op.alter_column(
+            'updated_at',
+            existing_type=sa.DateTime(timezone=True),
+            server_default=sa.func.now()
+        )
+    op.create_index('ix_feature_flags_project_updated_at', 'feature_flags', ['project_id', 'updated_at'])
+
+    op.create_table(
+        'feature_flag_deletions',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('flag_id', sa.Integer(), nullable=False),
+        sa.Column('project_id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(), nullable=False),
+        # Reuses the enum type created with feature_flags
+        sa.Column('environment', postgresql.ENUM('DEV', 'STAGING', 'PROD', name='environment', create_type=False),
+                  nullable=False),
+        sa.Column('deleted_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(
+        'ix_feature_flag_deletions_project_deleted_at', 'feature_flag_deletions', ['project_id', 'deleted_at']
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_feature_flag_deletions_project_deleted_at', table_name='feature_flag_deletions')
+    op.drop_table('feature_flag_deletions')
+    op.drop_index('ix_feature_flags_project_updated_at', table_name='feature_flags')
+    with op.batch_alter_table('feature_flags') as batch_op:
+        batch_op.alter_column(
+            'updated_at',
+            existing_type=sa.DateTime(timezone=True),
+            server_default=None
+        )
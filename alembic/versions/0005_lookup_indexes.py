@@ -0,0 +1,32 @@
+"""indexes for the flag and project lookup patterns
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-17 13:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Fails if racing creates already left duplicates behind; those have to be resolved by hand
+    with op.batch_alter_table('feature_flags') as batch_op:
+        batch_op.create_unique_constraint(
+            'uq_feature_flags_project_name_environment', ['project_id', 'name', 'environment']
+        )
+    op.create_index('ix_feature_flags_project_environment', 'feature_flags', ['project_id', 'environment', 'id'])
+    op.create_index('ix_projects_owner_id', 'projects', ['owner_id', 'id'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_projects_owner_id', table_name='projects')
+    op.drop_index('ix_feature_flags_project_environment', table_name='feature_flags')
+    with op.batch_alter_table('feature_flags') as batch_op:
+        batch_op.drop_constraint('uq_feature_flags_project_name_environment', type_='unique')
@@ -0,0 +1,534 @@
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import and_, case, delete, func, insert, literal, select, true, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from . import models, schemas
+from .auth import password_hasher
+from .cache import FlagListing, build_flag_listing, flag_cache
+from .config import settings
+from .crud import TOKEN_SENSITIVE_FIELDS
+from .notifications import FlagChange, publish_flag_change_async, publish_flag_changes_async
+from .revocations import revocations
+from .serialization import schema_columns
+from typing import Dict, List, Optional, Tuple
+
+
+# Async counterparts of the functions in crud.py, used by the request handlers.
+# Sessions come from AsyncSessionLocal (expire_on_commit=False), so objects stay
+# loaded after commit; rows with server-side defaults are refreshed explicitly.
+
+
+# User CRUD operations
+async def get_user(db: AsyncSession, user_id: int):
+    return await db.scalar(select(models.User).where(models.User.id == user_id))
+
+
+async def get_user_by_email(db: AsyncSession, email: str):
+    return await db.scalar(select(models.User).where(models.User.email == email))
+
+
+async def get_user_by_username(db: AsyncSession, username: str):
+    return await db.scalar(select(models.User).where(models.User.username == username))
+
+
+async def _rows(db: AsyncSession, query) -> List[dict]:
+    # Plain dicts of the selected columns, without ORM instances or identity-map bookkeeping
+    result = await db.execute(query)
+    return [dict(row) for row in result.mappings()]
+
+
+async def get_user_rows(db: AsyncSession, skip: int = 0, limit: int = 100, after_id: Optional[int] = None):
+    query = select(*schema_columns(models.User, schemas.User))
+    if after_id is not None:
+        query = query.where(models.User.id > after_id)
+    return await _rows(db, query.order_by(models.User.id).offset(skip).limit(limit))
+
+
+async def create_user(db: AsyncSession, user: schemas.UserCreate, hashed_password: Optional[str] = None):
+    if hashed_password is None:
+        hashed_password = await password_hasher.hash(user.password)
+    db_user = models.User(
+        email=user.email,
+        username=user.username,
+        hashed_password=hashed_password,
+        role=user.role
+    )
+    db.add(db_user)
+    await db.commit()
+    await db.refresh(db_user)
+    return db_user
+
+
+async def _revoke_user_tokens(db: AsyncSession, user_id: int, min_token_version: int):
+    await db.merge(models.TokenRevocation(user_id=user_id, min_token_version=min_token_version, revoked_at=func.now()))
+
+
+async def update_user(db: AsyncSession, user_id: int, user_update: schemas.UserUpdate):
+    db_user = await get_user(db, user_id)
+    if not db_user:
+        return None
+
+    update_data = user_update.dict(exclude_unset=True)
+    for field, value in update_data.items():
+        if field == "password":
+            field, value = "hashed_password", await password_hasher.hash(value)
+        setattr(db_user, field, value)
+
+    revoke = TOKEN_SENSITIVE_FIELDS.intersection(update_data)
+    if revoke:
+        db_user.token_version = (db_user.token_version or 0) + 1
+        await _revoke_user_tokens(db, user_id, db_user.token_version)
+
+    await db.commit()
+    await db.refresh(db_user)
+    if revoke:
+        revocations.record(user_id, db_user.token_version)
+    return db_user
+
+
+async def delete_user(db: AsyncSession, user_id: int):
+    db_user = await get_user(db, user_id)
+    if db_user:
+        min_token_version = (db_user.token_version or 0) + 1
+        await _revoke_user_tokens(db, user_id, min_token_version)
+        await db.delete(db_user)
+        await db.commit()
+        revocations.record(user_id, min_token_version)
+    return db_user
+
+
+# Project CRUD operations
+async def get_project(db: AsyncSession, project_id: int):
+    return await db.scalar(select(models.Project).where(models.Project.id == project_id))
+
+
+async def get_project_rows(
+    db: AsyncSession,
+    skip: int = 0,
+    limit: int = 100,
+    owner_id: Optional[int] = None,
+    after_id: Optional[int] = None
+):
+    query = select(*schema_columns(models.Project, schemas.Project))
+    if owner_id:
+        query = query.where(models.Project.owner_id == owner_id)
+    if after_id is not None:
+        query = query.where(models.Project.id > after_id)
+    return await _rows(db, query.order_by(models.Project.id).offset(skip).limit(limit))
+
+
+async def create_project(db: AsyncSession, project: schemas.ProjectCreate, owner_id: int):
+    db_project = models.Project(**project.dict(), owner_id=owner_id)
+    db.add(db_project)
+    await db.commit()
+    await db.refresh(db_project)
+    return db_project
+
+
+async def update_project(db: AsyncSession, project_id: int, project_update: schemas.ProjectUpdate):
+    db_project = await get_project(db, project_id)
+    if not db_project:
+        return None
+
+    update_data = project_update.dict(exclude_unset=True)
+    for field, value in update_data.items():
+        setattr(db_project, field, value)
+
+    await db.commit()
+    await db.refresh(db_project)
+    return db_project
+
+
+async def delete_project(db: AsyncSession, project_id: int):
+    db_project = await get_project(db, project_id)
+    if db_project:
+        await db.delete(db_project)
+        await db.commit()
+        await _flag_scope_changed(db, project_id)
+    return db_project
+
+
+# Feature Flag CRUD operations
+async def _flag_scope_changed(
+    db: AsyncSession,
+    project_id: int,
+    environment: Optional[models.Environment] = None,
+    event: Optional[str] = None,
+    flag: Optional[schemas.FeatureFlag] = None,
+    previous_environment: Optional[models.Environment] = None
+):
+    # Drop the local cache first, then tell stream subscribers and the other workers
+    version = flag_cache.invalidate(project_id, environment)
+    flag_data = flag.model_dump(mode="json") if flag is not None else None
+    await publish_flag_change_async(
+        db, FlagChange(project_id, environment, version, event, flag_data, previous_environment)
+    )
+
+
+async def get_feature_flag(db: AsyncSession, flag_id: int):
+    return await db.scalar(select(models.FeatureFlag).where(models.FeatureFlag.id == flag_id))
+
+
+def _accessible_by(owner_id: Optional[int]):
+    # Permission predicate for flag statements; None (admins) means unrestricted
+    if owner_id is None:
+        return true()
+    return models.FeatureFlag.project_id.in_(
+        select(models.Project.id).where(models.Project.owner_id == owner_id)
+    )
+
+
+async def get_feature_flag_with_owner(db: AsyncSession, flag_id: int) -> Optional[Tuple[models.FeatureFlag, int]]:
+    row = (await db.execute(
+        select(models.FeatureFlag, models.Project.owner_id)
+        .join(models.Project, models.Project.id == models.FeatureFlag.project_id)
+        .where(models.FeatureFlag.id == flag_id)
+    )).first()
+    return tuple(row) if row is not None else None
+
+
+def _feature_flags_page(query, skip: int, limit: Optional[int], project_id: Optional[int],
+                        environment: Optional[models.Environment], after_id: Optional[int]):
+    if project_id:
+        query = query.where(models.FeatureFlag.project_id == project_id)
+    if environment:
+        query = query.where(models.FeatureFlag.environment == environment)
+    # Keyset pagination: seeks on the primary key instead of scanning past skipped rows
+    if after_id is not None:
+        query = query.where(models.FeatureFlag.id > after_id)
+    return query.order_by(models.FeatureFlag.id).offset(skip).limit(limit)
+
+
+async def get_feature_flags(
+    db: AsyncSession,
+    skip: int = 0,
+    limit: int = 100,
+    project_id: Optional[int] = None,
+    environment: Optional[models.Environment] = None,
+    after_id: Optional[int] = None
+):
+    query = _feature_flags_page(select(models.FeatureFlag), skip, limit, project_id, environment, after_id)
+    result = await db.scalars(query)
+    return result.all()
+
+
+async def get_feature_flag_rows(
+    db: AsyncSession,
+    skip: int = 0,
+    limit: int = 100,
+    project_id: Optional[int] = None,
+    environment: Optional[models.Environment] = None,
+    after_id: Optional[int] = None
+):
+    query = select(*schema_columns(models.FeatureFlag, schemas.FeatureFlag))
+    return await _rows(db, _feature_flags_page(query, skip, limit, project_id, environment, after_id))
+
+
+async def get_project_flag_listing(
+    db: AsyncSession,
+    project_id: int,
+    environment: Optional[models.Environment] = None
+) -> FlagListing:
+    key = (project_id, environment)
+    entry = flag_cache.get(key)
+    if entry is not None:
+        return entry.value
+
+    version = flag_cache.version(key)
+    db_flags = await get_feature_flags(db, limit=None, project_id=project_id, environment=environment)
+    listing = build_flag_listing(project_id, environment, tuple(
+        schemas.FeatureFlag.model_validate(db_flag) for db_flag in db_flags
+    ))
+    flag_cache.set(key, listing, version)
+    return listing
+
+
+async def get_recently_changed_projects(db: AsyncSession, limit: int) -> List[models.Project]:
+    recent = (
+        select(models.FeatureFlag.project_id, func.max(models.FeatureFlag.updated_at).label("changed_at"))
+        .group_by(models.FeatureFlag.project_id)
+        .order_by(func.max(models.FeatureFlag.updated_at).desc())
+        .limit(limit)
+        .subquery()
+    )
+    result = await db.scalars(
+        select(models.Project)
+        .join(recent, models.Project.id == recent.c.project_id)
+        .order_by(recent.c.changed_at.desc())
+    )
+    return result.all()
+
+
+async def warm_flag_listings(db: AsyncSession, project_ids: List[int]) -> Dict[tuple, FlagListing]:
+    """Caches every listing of the given projects from a single query; returns those cached."""
+    keys = [(project_id, environment) for project_id in project_ids for environment in (*models.Environment, None)]
+    versions = {key: flag_cache.version(key) for key in keys}
+    grouped: Dict[tuple, list] = {key: [] for key in keys}
+    # Same order as get_feature_flags, so the listings and their ETags match a regular fill
+    db_flags = await db.scalars(
+        select(models.FeatureFlag)
+        .where(models.FeatureFlag.project_id.in_(project_ids))
+        .order_by(models.FeatureFlag.id)
+    )
+    for db_flag in db_flags:
+        flag = schemas.FeatureFlag.model_validate(db_flag)
+        grouped[(db_flag.project_id, None)].append(flag)
+        grouped[(db_flag.project_id, db_flag.environment)].append(flag)
+
+    listings = {}
+    for key, flags in grouped.items():
+        listing = build_flag_listing(key[0], key[1], tuple(flags))
+        if flag_cache.set(key, listing, versions[key]) is not None:
+            listings[key] = listing
+    return listings
+
+
+async def get_project_feature_flags(
+    db: AsyncSession,
+    project_id: int,
+    environment: Optional[models.Environment] = None
+) -> Tuple[schemas.FeatureFlag, ...]:
+    listing = await get_project_flag_listing(db, project_id=project_id, environment=environment)
+    return listing.flags
+
+
+async def create_feature_flag(db: AsyncSession, flag: schemas.FeatureFlagCreate, created_by_id: int):
+    db_flag = models.FeatureFlag(**flag.dict(), created_by_id=created_by_id)
+    db.add(db_flag)
+    await db.commit()
+    await db.refresh(db_flag)
+    await _flag_scope_changed(
+        db, db_flag.project_id, db_flag.environment, "created", schemas.FeatureFlag.model_validate(db_flag)
+    )
+    return db_flag
+
+
+async def get_database_time(db: AsyncSession) -> datetime:
+    now = await db.scalar(select(func.now()))
+    # SQLite hands back naive UTC
+    return now if now.tzinfo is not None else now.replace(tzinfo=timezone.utc)
+
+
+async def get_flag_changes(
+    db: AsyncSession,
+    project_id: int,
+    since: Optional[datetime] = None,
+    environment: Optional[models.Environment] = None
+) -> Tuple[list, list]:
+    """Flags updated and tombstones recorded at or after ``since`` (everything if None)."""
+    query = select(models.FeatureFlag).where(models.FeatureFlag.project_id == project_id)
+    if environment:
+        query = query.where(models.FeatureFlag.environment == environment)
+    if since is not None:
+        query = query.where(models.FeatureFlag.updated_at >= since)
+    upserts = (await db.scalars(query.order_by(models.FeatureFlag.updated_at, models.FeatureFlag.id))).all()
+    if since is None:
+        return upserts, []
+
+    query = select(models.FeatureFlagDeletion).where(
+        models.FeatureFlagDeletion.project_id == project_id,
+        models.FeatureFlagDeletion.deleted_at >= since
+    )
+    if environment:
+        query = query.where(models.FeatureFlagDeletion.environment == environment)
+    deletes = (await db.scalars(query.order_by(models.FeatureFlagDeletion.id))).all()
+    return upserts, deletes
+
+
+async def _record_flag_deletion(db: AsyncSession, db_flag: models.FeatureFlag, environment: models.Environment):
+    # Tombstone for the changes feed; old ones are pruned while we're here
+    cutoff = datetime.now(timezone.utc) - timedelta(days=settings.flag_deletion_retention_days)
+    await db.execute(delete(models.FeatureFlagDeletion).where(models.FeatureFlagDeletion.deleted_at < cutoff))
+    db.add(models.FeatureFlagDeletion(
+        flag_id=db_flag.id, project_id=db_flag.project_id, name=db_flag.name, environment=environment
+    ))
+
+
+async def update_feature_flag(
+    db: AsyncSession,
+    flag_id: int,
+    flag_update: schemas.FeatureFlagUpdate,
+    owner_id: Optional[int] = None
+):
+    """Update in a single UPDATE ... RETURNING.
+
+    Returns None when the flag doesn't exist or its project isn't owned by
+    ``owner_id``.
+    """
+    update_data = flag_update.dict(exclude_unset=True)
+    accessible = and_(models.FeatureFlag.id == flag_id, _accessible_by(owner_id))
+    if not update_data:
+        return await db.scalar(select(models.FeatureFlag).where(accessible))
+
+    previous_environment = None
+    if "environment" in update_data:
+        # RETURNING only sees the new row, so a possible move reads the old environment first
+        previous_environment = await db.scalar(select(models.FeatureFlag.environment).where(accessible))
+        if previous_environment is None:
+            return None
+
+    db_flag = await db.scalar(
+        update(models.FeatureFlag).where(accessible).values(**update_data).returning(models.FeatureFlag),
+        execution_options={"populate_existing": True}
+    )
+    if db_flag is None:
+        return None
+    if previous_environment is not None and db_flag.environment != previous_environment:
+        # Gone from the old environment as far as its changes feed is concerned
+        await _record_flag_deletion(db, db_flag, previous_environment)
+
+    await db.commit()
+    # The environment may have changed, so drop every environment of the project
+    await _flag_scope_changed(
+        db, db_flag.project_id, None, "updated", schemas.FeatureFlag.model_validate(db_flag),
+        previous_environment or db_flag.environment
+    )
+    return db_flag
+
+
+async def delete_feature_flag(db: AsyncSession, flag_id: int, owner_id: Optional[int] = None):
+    """Delete in a single DELETE ... RETURNING; None when missing or not owned by ``owner_id``."""
+    db_flag = await db.scalar(
+        delete(models.FeatureFlag)
+        .where(models.FeatureFlag.id == flag_id, _accessible_by(owner_id))
+        .returning(models.FeatureFlag)
+    )
+    if db_flag is None:
+        return None
+    deleted_flag = schemas.FeatureFlag.model_validate(db_flag)
+    await _record_flag_deletion(db, db_flag, db_flag.environment)
+    await db.commit()
+    await _flag_scope_changed(db, deleted_flag.project_id, deleted_flag.environment, "deleted", deleted_flag)
+    return db_flag
+
+
+# Bulk operations: one statement per batch, per-flag notifications sent together
+async def _flags_changed(db: AsyncSession, event: str, flags: List[models.FeatureFlag],
+                        previous_environments: Optional[Dict[int, models.Environment]] = None):
+    # previous_environments is given for updates that may move flags between environments
+    changes = []
+    for db_flag in flags:
+        environment = None if previous_environments is not None else db_flag.environment
+        previous_environment = (
+            previous_environments.get(db_flag.id, db_flag.environment) if previous_environments is not None else None
+        )
+        version = flag_cache.invalidate(db_flag.project_id, environment)
+        flag_data = schemas.FeatureFlag.model_validate(db_flag).model_dump(mode="json")
+        changes.append(FlagChange(db_flag.project_id, environment, version, event, flag_data, previous_environment))
+    await publish_flag_changes_async(db, changes)
+
+
+async def get_existing_flag_ids(db: AsyncSession, flag_ids) -> set:
+    return set((await db.scalars(select(models.FeatureFlag.id).where(models.FeatureFlag.id.in_(flag_ids)))).all())
+
+
+async def get_project_owners(db: AsyncSession, project_ids) -> Dict[int, int]:
+    rows = await db.execute(
+        select(models.Project.id, models.Project.owner_id).where(models.Project.id.in_(set(project_ids)))
+    )
+    return dict(rows.all())
+
+
+def _insert_skipping_duplicates(db: AsyncSession):
+    dialects = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+    dialect_insert = dialects.get(db.bind.dialect.name)
+    if dialect_insert is None:
+        # Without ON CONFLICT a duplicate fails the whole batch with IntegrityError
+        return insert(models.FeatureFlag)
+    return dialect_insert(models.FeatureFlag).on_conflict_do_nothing(
+        index_elements=["project_id", "name", "environment"]
+    )
+
+
+async def create_feature_flags(
+    db: AsyncSession,
+    flags: List[schemas.FeatureFlagCreate],
+    created_by_id: int
+) -> List[models.FeatureFlag]:
+    """Insert in one multi-row INSERT ... RETURNING.
+
+    Flags clashing with an existing (project_id, name, environment) are skipped
+    and missing from the result, which is in no particular order.
+    """
+    rows = [{**flag.dict(), "created_by_id": created_by_id} for flag in flags]
+    created = (await db.scalars(_insert_skipping_duplicates(db).returning(models.FeatureFlag), rows)).all()
+    await db.commit()
+    await _flags_changed(db, "created", created)
+    return created
+
+
+async def update_feature_flags(
+    db: AsyncSession,
+    updates: Dict[int, dict],
+    owner_id: Optional[int] = None
+) -> List[models.FeatureFlag]:
+    """Apply per-flag changes (keyed by flag id) in one UPDATE ... RETURNING.
+
+    Each column gets a CASE over the ids that change it. Flags missing or not
+    owned by ``owner_id`` are left out of the result.
+    """
+    accessible = and_(models.FeatureFlag.id.in_(updates), _accessible_by(owner_id))
+    columns = models.FeatureFlag.__table__.c
+    fields = {field for changes in updates.values() for field in changes}
+    if not fields:
+        return (await db.scalars(select(models.FeatureFlag).where(accessible))).all()
+
+    previous_environments = {}
+    if "environment" in fields:
+        # As in update_feature_flag: RETURNING can't tell which flags moved
+        rows = await db.execute(select(models.FeatureFlag.id, models.FeatureFlag.environment).where(accessible))
+        previous_environments = dict(rows.all())
+
+    values = {
+        field: case(
+            *[
+                (models.FeatureFlag.id == flag_id, literal(changes[field], columns[field].type))
+                for flag_id, changes in updates.items() if field in changes
+            ],
+            else_=columns[field]
+        )
+        for field in fields
+    }
+    updated = (await db.scalars(
+        update(models.FeatureFlag).where(accessible).values(values).returning(models.FeatureFlag),
+        execution_options={"populate_existing": True, "synchronize_session": False}
+    )).all()
+    for db_flag in updated:
+        previous_environment = previous_environments.get(db_flag.id)
+        if previous_environment is not None and previous_environment != db_flag.environment:
+            await _record_flag_deletion(db, db_flag, previous_environment)
+    await db.commit()
+    await _flags_changed(db, "updated", updated, previous_environments=previous_environments)
+    return updated
+
+
+async def set_feature_flags_enabled(
+    db: AsyncSession,
+    project_id: int,
+    environments: List[models.Environment],
+    names: List[str],
+    is_enabled: bool
+) -> List[models.FeatureFlag]:
+    updated = (await db.scalars(
+        update(models.FeatureFlag)
+        .where(
+            models.FeatureFlag.project_id == project_id,
+            models.FeatureFlag.environment.in_(environments),
+            models.FeatureFlag.name.in_(names)
+        )
+        .values(is_enabled=is_enabled)
+        .returning(models.FeatureFlag),
+        execution_options={"populate_existing": True, "synchronize_session": False}
+    )).all()
+    await db.commit()
+    await _flags_changed(db, "updated", updated)
+    return updated
+
+
+async def get_feature_flag_by_name_and_project(db: AsyncSession, name: str, project_id: int):
+    return await db.scalar(select(models.FeatureFlag).where(
+        and_(
+            models.FeatureFlag.name == name,
+            models.FeatureFlag.project_id == project_id
+        )
+    ))
@@ -1,14 +1,18 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
-from .database import get_db
-from .models import User
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from .database import get_async_db
+from .models import User, UserRole
 from .schemas import TokenData
 from .config import settings
+from .revocations import revocations
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
@@ -22,15 +26,108 @@ def get_password_hash(password):
     return pwd_context.hash(password)
 
 
-def authenticate_user(db: Session, username: str, password: str):
-    user = db.query(User).filter(User.username == username).first()
+class PasswordHasher:
+    """Runs bcrypt on a dedicated, bounded thread pool.
+
+    bcrypt releases the GIL, so a few threads keep hashing off the event loop
+    and out of the threadpool that serves regular requests. Once
+    ``max_pending`` operations are queued, new ones are refused with a 503
+    instead of piling up behind a login storm.
+    """
+
+    def __init__(self, max_workers: int, max_pending: int):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        # Only touched from the event loop, so no lock is needed
+        self.pending = 0
+        self.rejected = 0
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="password-hash")
+
+    async def _run(self, func, *args):
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Too many concurrent authentication requests",
+                headers={"Retry-After": "1"},
+            )
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+        finally:
+            self.pending -= 1
+
+    async def hash(self, password: str) -> str:
+        return await self._run(get_password_hash, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run(verify_password, plain_password, hashed_password)
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.max_workers,
+            "pending": self.pending,
+            "max_pending": self.max_pending,
+            "rejected": self.rejected,
+        }
+
+
+password_hasher = PasswordHasher(
+    max_workers=settings.password_hash_workers,
+    max_pending=settings.password_hash_max_pending,
+)
+
+
+async def _get_user_by_username(db: AsyncSession, username: str):
+    return await db.scalar(select(User).where(User.username == username))
+
+
+async def authenticate_user(db: AsyncSession, username: str, password: str):
+    user = await _get_user_by_username(db, username)
     if not user:
         return False
-    if not verify_password(password, user.hashed_password):
+    if not await password_hasher.verify(password, user.hashed_password):
         return False
     return user
 
 
+class TokenUser:
+    """Authenticated user rebuilt from verified token claims, without a users lookup."""
+
+    __slots__ = ("id", "username", "role", "is_active", "token_version")
+
+    def __init__(self, id: int, username: str, role: UserRole, is_active: bool, token_version: int):
+        self.id = id
+        self.username = username
+        self.role = role
+        self.is_active = is_active
+        self.token_version = token_version
+
+
+def token_claims(user: User) -> dict:
+    return {
+        "sub": user.username,
+        "uid": user.id,
+        "role": user.role.value,
+        "active": bool(user.is_active),
+        "ver": user.token_version or 0,
+    }
+
+
+def user_from_claims(payload: dict) -> Optional[TokenUser]:
+    try:
+        return TokenUser(
+            id=int(payload["uid"]),
+            username=payload["sub"],
+            role=UserRole(payload["role"]),
+            is_active=bool(payload["active"]),
+            token_version=int(payload["ver"]),
+        )
+    except (KeyError, TypeError, ValueError):
+        # Tokens issued before these claims existed go through the database
+        return None
+
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
@@ -42,7 +139,7 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     return encoded_jwt
 
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -56,9 +153,19 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
         token_data = TokenData(username=username)
     except JWTError:
         raise credentials_exception
-    user = db.query(User).filter(User.username == token_data.username).first()
+
+    if settings.stateless_auth and revocations.loaded:
+        token_user = user_from_claims(payload)
+        if token_user is not None:
+            if revocations.is_revoked(token_user.id, token_user.token_version):
+                raise credentials_exception
+            return token_user
+
+    user = await _get_user_by_username(db, token_data.username)
     if user is None:
         raise credentials_exception
+    if payload.get("ver") is not None and payload["ver"] < user.token_version:
+        raise credentials_exception
     return user
 
 
@@ -0,0 +1,151 @@
+import gzip
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, NamedTuple, Optional, Tuple
+from pydantic import TypeAdapter
+from .config import settings
+from .models import Environment
+from .schemas import FeatureFlag
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; snapshots are then offered as gzip only
+    brotli = None
+
+# (project_id, environment); environment is None for the all-environments listing
+CacheKey = Tuple[int, Optional[Environment]]
+
+
+class FlagListing(NamedTuple):
+    flags: Tuple[FeatureFlag, ...]
+    # Strong validator derived from the listing's content, identical across workers
+    etag: str
+    # Ready-to-send snapshot document, keyed by content coding ("identity", "gzip", "br")
+    snapshot: Dict[str, bytes]
+
+
+_flags_adapter = TypeAdapter(Tuple[FeatureFlag, ...])
+
+
+def build_flag_listing(project_id: int, environment: Optional[Environment],
+                       flags: Tuple[FeatureFlag, ...]) -> FlagListing:
+    flags_json = _flags_adapter.dump_json(flags)
+    digest = hashlib.blake2b(flags_json, digest_size=16).hexdigest()
+
+    header = json.dumps({
+        "project_id": project_id,
+        "environment": environment.value if environment is not None else None,
+    }, separators=(",", ":"))
+    document = header[:-1].encode() + b',"flags":' + flags_json + b"}"
+    snapshot = {"identity": document}
+    if len(document) >= settings.snapshot_compression_min_bytes:
+        snapshot["gzip"] = gzip.compress(document, compresslevel=6, mtime=0)
+        if brotli is not None:
+            snapshot["br"] = brotli.compress(document)
+    return FlagListing(flags, f'"{digest}"', snapshot)
+
+
+class CacheEntry(NamedTuple):
+    version: int
+    value: Any
+    expires_at: float
+
+
+class FlagCache:
+    """Process-wide cache of project flag listings keyed by (project_id, environment).
+
+    Every key has a version that only ever increases. Writers bump it through
+    ``invalidate``; readers capture it with ``version`` before loading from the
+    database and hand it back to ``set``, so a fill that raced with a write is
+    discarded instead of resurrecting stale rows. Versions are kept for the
+    ``max_entries`` most recently written keys; older ones are folded into the
+    epoch, which only ever makes ``set`` more conservative.
+    """
+
+    def __init__(self, ttl_seconds: float = 300, max_entries: int = 10000):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[CacheKey, CacheEntry]" = OrderedDict()
+        self._versions: "OrderedDict[CacheKey, int]" = OrderedDict()
+        self._clock = 0
+        # Version floor for every key, raised by invalidate_all and by pruning _versions
+        self._epoch = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def version(self, key: CacheKey) -> int:
+        return max(self._versions.get(key, 0), self._epoch)
+
+    def get(self, key: CacheKey) -> Optional[CacheEntry]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry.expires_at <= time.monotonic():
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def set(self, key: CacheKey, value: Any, version: int) -> Optional[CacheEntry]:
+        with self._lock:
+            if max(self._versions.get(key, 0), self._epoch) != version:
+                return None
+            entry = CacheEntry(version, value, time.monotonic() + self.ttl_seconds)
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            return entry
+
+    def invalidate(self, project_id: int, environment: Optional[Environment] = None) -> int:
+        # A write to one environment also changes the project's unfiltered listing
+        environments = [environment] if environment is not None else list(Environment)
+        with self._lock:
+            self._clock += 1
+            for key in [(project_id, env) for env in environments] + [(project_id, None)]:
+                self._versions[key] = self._clock
+                self._versions.move_to_end(key)
+                self._entries.pop(key, None)
+            while len(self._versions) > self.max_entries:
+                _, version = self._versions.popitem(last=False)
+                self._epoch = max(self._epoch, version)
+            return self._clock
+
+    def invalidate_all(self) -> int:
+        with self._lock:
+            self._clock += 1
+            self._epoch = self._clock
+            self._entries.clear()
+            # Every version is now below the epoch
+            self._versions.clear()
+            return self._clock
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+flag_cache = FlagCache(
+    ttl_seconds=settings.flag_cache_ttl_seconds,
+    max_entries=settings.flag_cache_max_entries,
+)
@@ -0,0 +1,49 @@
+from typing import Iterable, Optional
+from fastapi import Response, status
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # If-None-Match uses the weak comparison, so W/ prefixes are ignored
+    candidates = (candidate.strip() for candidate in if_none_match.split(","))
+    return any(candidate.removeprefix("W/") == etag for candidate in candidates)
+
+
+def variant_etag(etag: str, *variant) -> str:
+    # Representations of the same content (a page of it, another encoding or document)
+    # each need their own strong validator
+    return f'{etag[:-1]}-{"-".join(str(part) for part in variant)}"'
+
+
+def not_modified(etag: str, headers: Optional[dict] = None) -> Response:
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag, **(headers or {})})
+
+
+def set_etag(response: Response, etag: str):
+    response.headers["ETag"] = etag
+    # Clients may keep the body but must revalidate before reusing it
+    response.headers["Cache-Control"] = "private, no-cache"
+
+
+def preferred_encoding(accept_encoding: Optional[str], available: Iterable[str]) -> str:
+    if not accept_encoding:
+        return "identity"
+    accepted = {}
+    for item in accept_encoding.split(","):
+        coding, _, params = item.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[coding.strip().lower()] = quality
+    # Prefer the smallest representation the client accepts
+    for coding in ("br", "gzip"):
+        if coding in available and accepted.get(coding, accepted.get("*", 0.0)) > 0:
+            return coding
+    return "identity"
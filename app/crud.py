@@ -1,8 +1,13 @@
 
+from datetime import datetime, timedelta, timezone
 from sqlalchemy.orm import Session
-from sqlalchemy import and_
+from sqlalchemy import and_, func
 from . import models, schemas
 from .auth import get_password_hash
+from .cache import flag_cache
+from .config import settings
+from .notifications import FlagChange, publish_flag_change
+from .revocations import revocations
 from typing import List, Optional
 
 
@@ -19,12 +24,16 @@ def get_user_by_username(db: Session, username: str):
     return db.query(models.User).filter(models.User.username == username).first()
 
 
-def get_users(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.User).offset(skip).limit(limit).all()
+def get_users(db: Session, skip: int = 0, limit: int = 100, after_id: Optional[int] = None):
+    query = db.query(models.User)
+    if after_id is not None:
+        query = query.filter(models.User.id > after_id)
+    return query.order_by(models.User.id).offset(skip).limit(limit).all()
 
 
-def create_user(db: Session, user: schemas.UserCreate):
-    hashed_password = get_password_hash(user.password)
+def create_user(db: Session, user: schemas.UserCreate, hashed_password: Optional[str] = None):
+    if hashed_password is None:
+        hashed_password = get_password_hash(user.password)
     db_user = models.User(
         email=user.email,
         username=user.username,
@@ -37,6 +46,14 @@ def create_user(db: Session, user: schemas.UserCreate):
     return db_user
 
 
+# Changing any of these invalidates the user's outstanding tokens
+TOKEN_SENSITIVE_FIELDS = {"role", "is_active", "password"}
+
+
+def _revoke_user_tokens(db: Session, user_id: int, min_token_version: int):
+    db.merge(models.TokenRevocation(user_id=user_id, min_token_version=min_token_version, revoked_at=func.now()))
+
+
 def update_user(db: Session, user_id: int, user_update: schemas.UserUpdate):
     db_user = get_user(db, user_id)
     if not db_user:
@@ -45,19 +62,29 @@ def update_user(db: Session, user_id: int, user_update: schemas.UserUpdate):
     update_data = user_update.dict(exclude_unset=True)
     for field, value in update_data.items():
         if field == "password":
-            value = get_password_hash(value)
+            field, value = "hashed_password", get_password_hash(value)
         setattr(db_user, field, value)
+
+    revoke = TOKEN_SENSITIVE_FIELDS.intersection(update_data)
+    if revoke:
+        db_user.token_version = (db_user.token_version or 0) + 1
+        _revoke_user_tokens(db, user_id, db_user.token_version)
     
     db.commit()
     db.refresh(db_user)
+    if revoke:
+        revocations.record(user_id, db_user.token_version)
     return db_user
 
 
 def delete_user(db: Session, user_id: int):
     db_user = get_user(db, user_id)
     if db_user:
+        min_token_version = (db_user.token_version or 0) + 1
+        _revoke_user_tokens(db, user_id, min_token_version)
         db.delete(db_user)
         db.commit()
+        revocations.record(user_id, min_token_version)
     return db_user
 
 
@@ -66,11 +93,19 @@ def get_project(db: Session, project_id: int):
     return db.query(models.Project).filter(models.Project.id == project_id).first()
 
 
-def get_projects(db: Session, skip: int = 0, limit: int = 100, owner_id: Optional[int] = None):
+def get_projects(
+    db: Session,
+    skip: int = 0,
+    limit: int = 100,
+    owner_id: Optional[int] = None,
+    after_id: Optional[int] = None
+):
     query = db.query(models.Project)
     if owner_id:
         query = query.filter(models.Project.owner_id == owner_id)
-    return query.offset(skip).limit(limit).all()
+    if after_id is not None:
+        query = query.filter(models.Project.id > after_id)
+    return query.order_by(models.Project.id).offset(skip).limit(limit).all()
 
 
 def create_project(db: Session, project: schemas.ProjectCreate, owner_id: int):
@@ -100,10 +135,27 @@ def delete_project(db: Session, project_id: int):
     if db_project:
         db.delete(db_project)
         db.commit()
+        _flag_scope_changed(db, project_id)
     return db_project
 
 
 # Feature Flag CRUD operations
+def _flag_scope_changed(
+    db: Session,
+    project_id: int,
+    environment: Optional[models.Environment] = None,
+    event: Optional[str] = None,
+    flag: Optional[schemas.FeatureFlag] = None,
+    previous_environment: Optional[models.Environment] = None
+):
+    # Drop the local cache first, then tell stream subscribers and the other workers
+    version = flag_cache.invalidate(project_id, environment)
+    flag_data = flag.model_dump(mode="json") if flag is not None else None
+    publish_flag_change(
+        db, FlagChange(project_id, environment, version, event, flag_data, previous_environment)
+    )
+
+
 def get_feature_flag(db: Session, flag_id: int):
     return db.query(models.FeatureFlag).filter(models.FeatureFlag.id == flag_id).first()
 
@@ -113,14 +165,18 @@ def get_feature_flags(
     skip: int = 0, 
     limit: int = 100, 
     project_id: Optional[int] = None,
-    environment: Optional[models.Environment] = None
+    environment: Optional[models.Environment] = None,
+    after_id: Optional[int] = None
 ):
     query = db.query(models.FeatureFlag)
     if project_id:
         query = query.filter(models.FeatureFlag.project_id == project_id)
     if environment:
         query = query.filter(models.FeatureFlag.environment == environment)
-    return query.offset(skip).limit(limit).all()
+    # Keyset pagination: seeks on the primary key instead of scanning past skipped rows
+    if after_id is not None:
+        query = query.filter(models.FeatureFlag.id > after_id)
+    return query.order_by(models.FeatureFlag.id).offset(skip).limit(limit).all()
 
 
 def create_feature_flag(db: Session, flag: schemas.FeatureFlagCreate, created_by_id: int):
@@ -128,28 +184,51 @@ def create_feature_flag(db: Session, flag: schemas.FeatureFlagCreate, created_by
     db.add(db_flag)
     db.commit()
     db.refresh(db_flag)
+    _flag_scope_changed(
+        db, db_flag.project_id, db_flag.environment, "created", schemas.FeatureFlag.model_validate(db_flag)
+    )
     return db_flag
 
 
+def _record_flag_deletion(db: Session, db_flag: models.FeatureFlag, environment: models.Environment):
+    # Tombstone for the changes feed; old ones are pruned while we're here
+    cutoff = datetime.now(timezone.utc) - timedelta(days=settings.flag_deletion_retention_days)
+    db.query(models.FeatureFlagDeletion).filter(models.FeatureFlagDeletion.deleted_at < cutoff).delete()
+    db.add(models.FeatureFlagDeletion(
+        flag_id=db_flag.id, project_id=db_flag.project_id, name=db_flag.name, environment=environment
+    ))
+
+
 def update_feature_flag(db: Session, flag_id: int, flag_update: schemas.FeatureFlagUpdate):
     db_flag = get_feature_flag(db, flag_id)
     if not db_flag:
         return None
     
     update_data = flag_update.dict(exclude_unset=True)
+    previous_environment = db_flag.environment
     for field, value in update_data.items():
         setattr(db_flag, field, value)
+    if db_flag.environment != previous_environment:
+        # Gone from the old environment as far as its changes feed is concerned
+        _record_flag_deletion(db, db_flag, previous_environment)
     
     db.commit()
     db.refresh(db_flag)
+    # The environment may have changed, so drop every environment of the project
+    _flag_scope_changed(
+        db, db_flag.project_id, None, "updated", schemas.FeatureFlag.model_validate(db_flag), previous_environment
+    )
     return db_flag
 
 
 def delete_feature_flag(db: Session, flag_id: int):
     db_flag = get_feature_flag(db, flag_id)
     if db_flag:
+        deleted_flag = schemas.FeatureFlag.model_validate(db_flag)
+        _record_flag_deletion(db, db_flag, db_flag.environment)
         db.delete(db_flag)
         db.commit()
+        _flag_scope_changed(db, deleted_flag.project_id, deleted_flag.environment, "deleted", deleted_flag)
     return db_flag
 
 
@@ -1,11 +1,114 @@
-from sqlalchemy import create_engine
+import time
+import uuid
+from sqlalchemy import create_engine, event, exc
+from sqlalchemy.engine import URL, Engine, make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 from .config import settings
+from .telemetry import PoolStats
 
-engine = create_engine(settings.database_url)
+# Async drivers for the sync URLs accepted in DATABASE_URL
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+
+def get_async_database_url() -> str:
+    if settings.async_database_url:
+        return settings.async_database_url
+    url = make_url(settings.database_url)
+    return url.set(drivername=ASYNC_DRIVERS.get(url.get_backend_name(), url.drivername)).render_as_string(
+        hide_password=False
+    )
+
+
+def timed_pool(pool_class, stats: PoolStats):
+    class TimedPool(pool_class):
+        # Measures how long callers wait for a connection, including overflow connects
+        def _do_get(self):
+            started = time.perf_counter()
+            try:
+                connection = super()._do_get()
+            except exc.TimeoutError:
+                stats.timeouts += 1
+                raise
+            finally:
+                stats.wait_seconds.observe(time.perf_counter() - started)
+            stats.checkouts += 1
+            return connection
+
+    TimedPool.__name__ = TimedPool.__qualname__ = pool_class.__name__
+    return TimedPool
+
+
+def engine_options(url: URL, stats: PoolStats) -> dict:
+    if url.get_backend_name() != "postgresql":
+        # SQLite and friends keep SQLAlchemy's default pooling
+        return {}
+
+    is_async = url.get_dialect().is_async
+    options = {
+        "poolclass": timed_pool(AsyncAdaptedQueuePool if is_async else QueuePool, stats),
+        "pool_size": settings.db_pool_size,
+        "max_overflow": settings.db_max_overflow,
+        "pool_timeout": settings.db_pool_timeout,
+        "pool_recycle": settings.db_pool_recycle,
+        "pool_pre_ping": settings.db_pool_pre_ping,
+    }
+    connect_args = {}
+    if settings.db_pgbouncer:
+        # Transaction pooling hands each transaction to any server connection, so
+        # named prepared statements can't be reused and startup options are rejected
+        if is_async:
+            connect_args["statement_cache_size"] = 0
+            connect_args["prepared_statement_name_func"] = lambda: f"__asyncpg_{uuid.uuid4()}__"
+    elif settings.db_statement_timeout_ms:
+        if is_async:
+            connect_args["server_settings"] = {"statement_timeout": str(settings.db_statement_timeout_ms)}
+        else:
+            connect_args["options"] = f"-c statement_timeout={settings.db_statement_timeout_ms}"
+    if connect_args:
+        options["connect_args"] = connect_args
+    return options
+
+
+def set_local_statement_timeout(engine: Engine):
+    # PgBouncer rejects the startup option, so set the timeout per transaction; SET LOCAL
+    # ends with the transaction and can't leak to another client's server connection
+    statement = f"SET LOCAL statement_timeout = {int(settings.db_statement_timeout_ms)}"
+
+    @event.listens_for(engine, "begin")
+    def set_timeout(connection):
+        connection.exec_driver_sql(statement)
+
+
+def _async_url() -> URL:
+    url = make_url(get_async_database_url())
+    if settings.db_pgbouncer and url.get_backend_name() == "postgresql":
+        url = url.update_query_dict({"prepared_statement_cache_size": "0"})
+    return url
+
+
+pool_stats = PoolStats()
+async_pool_stats = PoolStats()
+
+_sync_url = make_url(settings.database_url)
+engine = create_engine(_sync_url, **engine_options(_sync_url, pool_stats))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Request handlers use the async engine; the sync one serves migrations and background threads
+_async_database_url = _async_url()
+async_engine = create_async_engine(_async_database_url, **engine_options(_async_database_url, async_pool_stats))
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+if settings.db_pgbouncer and settings.db_statement_timeout_ms:
+    for _url, _engine in ((_sync_url, engine), (_async_database_url, async_engine.sync_engine)):
+        if _url.get_backend_name() == "postgresql":
+            set_local_statement_timeout(_engine)
+
 Base = declarative_base()
 
 
@@ -14,4 +117,9 @@ def get_db():
     try:
         yield db
     finally:
-        db.close() 
\ No newline at end of file
+        db.close()
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -0,0 +1,303 @@
+import json
+import math
+from bisect import bisect_right
+from collections import OrderedDict
+from hashlib import blake2b
+from types import MappingProxyType
+from typing import Any, Dict, Iterable, Mapping, NamedTuple, Optional, Tuple
+from sqlalchemy.ext.asyncio import AsyncSession
+from . import async_crud, models, schemas
+from .config import settings
+
+NO_ATTRIBUTES: Mapping[str, Any] = MappingProxyType({})
+
+# Rollout percentages resolve to 0.01%
+ROLLOUT_BUCKETS = 10000
+_MASK64 = (1 << 64) - 1
+
+
+def stable_hash(value: str) -> int:
+    return int.from_bytes(blake2b(value.encode(), digest_size=8).digest(), "little")
+
+
+def rollout_bucket(flag_hash: int, user_hash: int) -> int:
+    """Bucket in [0, ROLLOUT_BUCKETS) for one flag and user.
+
+    Both inputs are ``stable_hash`` values computed once per flag and once per
+    user, so each extra flag costs only this splitmix64 finalizer. A user's
+    bucket never changes, which keeps rollouts sticky: raising the percentage
+    only adds users and lowering it only removes them.
+    """
+    z = flag_hash ^ user_hash
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & _MASK64
+    return (z ^ (z >> 31)) % ROLLOUT_BUCKETS
+
+
+# Compiled targeting rules; each answers for one user in O(1) set lookups or O(log n) bisection.
+# ``user_hash`` is the user's stable_hash, or None for anonymous contexts.
+class GroupMatch(NamedTuple):
+    groups: frozenset
+
+    def matches(self, groups: frozenset, attributes: Mapping[str, Any], user_hash: Optional[int]) -> bool:
+        return not self.groups.isdisjoint(groups)
+
+
+class ValueMatch(NamedTuple):
+    attribute: str
+    values: frozenset
+
+    def matches(self, groups: frozenset, attributes: Mapping[str, Any], user_hash: Optional[int]) -> bool:
+        try:
+            return attributes.get(self.attribute) in self.values
+        except TypeError:
+            # Unhashable attribute values never match
+            return False
+
+
+class RangeMatch(NamedTuple):
+    attribute: str
+    # Sorted, disjoint [start, end) intervals
+    starts: Tuple[float, ...]
+    ends: Tuple[float, ...]
+
+    def matches(self, groups: frozenset, attributes: Mapping[str, Any], user_hash: Optional[int]) -> bool:
+        value = attributes.get(self.attribute)
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            return False
+        index = bisect_right(self.starts, value) - 1
+        return index >= 0 and value < self.ends[index]
+
+
+class RolloutMatch(NamedTuple):
+    flag_hash: int
+    threshold: int
+
+    def matches(self, groups: frozenset, attributes: Mapping[str, Any], user_hash: Optional[int]) -> bool:
+        # Users without an id can't be bucketed consistently, so they stay out
+        return user_hash is not None and rollout_bucket(self.flag_hash, user_hash) < self.threshold
+
+
+def merge_ranges(ranges: Iterable[Tuple[Optional[float], Optional[float]]]) -> Tuple[Tuple[float, ...], Tuple[float, ...]]:
+    intervals = sorted(
+        (-math.inf if low is None else low, math.inf if high is None else high) for low, high in ranges
+    )
+    starts, ends = [], []
+    for low, high in intervals:
+        if ends and low <= ends[-1]:
+            ends[-1] = max(ends[-1], high)
+        else:
+            starts.append(low)
+            ends.append(high)
+    return tuple(starts), tuple(ends)
+
+
+def compile_rule(rule, flag_name: str):
+    if isinstance(rule, schemas.GroupRule):
+        return GroupMatch(frozenset(rule.groups))
+    if isinstance(rule, schemas.AttributeRule):
+        return ValueMatch(rule.attribute, frozenset(rule.values))
+    if isinstance(rule, schemas.RolloutRule):
+        return RolloutMatch(stable_hash(flag_name), round(rule.percentage * ROLLOUT_BUCKETS / 100))
+    return RangeMatch(rule.attribute, *merge_ranges(rule.ranges))
+
+
+class CompiledFlag(NamedTuple):
+    name: str
+    is_enabled: bool
+    # None means the flag is not targeted and applies to every user
+    rules: Optional[Tuple[Any, ...]]
+
+    def matches(self, groups: frozenset, attributes: Mapping[str, Any], user_hash: Optional[int]) -> bool:
+        if not self.is_enabled:
+            return False
+        if self.rules is None:
+            return True
+        return all(rule.matches(groups, attributes, user_hash) for rule in self.rules)
+
+
+def compile_flag(flag: schemas.FeatureFlag) -> CompiledFlag:
+    targeting = flag.user_group_targeting
+    rules = tuple(compile_rule(rule, flag.name) for rule in targeting.rules) if targeting is not None else ()
+    return CompiledFlag(
+        name=flag.name,
+        is_enabled=bool(flag.is_enabled),
+        rules=rules or None,
+    )
+
+
+class Ruleset(NamedTuple):
+    """Immutable, pre-parsed view of one project/environment's flags.
+
+    Besides the per-flag view, every flag is given a bit (in ``names`` order) so
+    a user can be resolved against all flags at once: ``base_mask`` holds the
+    enabled, untargeted flags and ``group_masks`` maps each group to the
+    enabled flags targeted by that group alone. Flags with any other rules are
+    listed in ``rule_flags`` and checked one by one, sharing a single hash of
+    the user id across all rollout rules.
+    """
+
+    project_id: int
+    environment: models.Environment
+    owner_id: int
+    flags: Mapping[str, CompiledFlag]
+    names: Tuple[str, ...]
+    base_mask: int
+    group_masks: Mapping[str, int]
+    rule_flags: Tuple[Tuple[int, CompiledFlag], ...]
+
+    def evaluate(self, groups: Iterable[str] = (), names: Optional[Iterable[str]] = None,
+                 attributes: Mapping[str, Any] = NO_ATTRIBUTES, user_id: Optional[str] = None) -> Dict[str, bool]:
+        user_groups = groups if isinstance(groups, (set, frozenset)) else frozenset(groups)
+        user_hash = stable_hash(user_id) if user_id is not None else None
+        if names is None:
+            selected = self.flags.values()
+        else:
+            # Unknown flags resolve to False rather than failing the whole request
+            selected = [self.flags.get(name) or CompiledFlag(name, False, None) for name in names]
+        return {flag.name: flag.matches(user_groups, attributes, user_hash) for flag in selected}
+
+    def evaluate_mask(self, groups: Iterable[str] = (), attributes: Mapping[str, Any] = NO_ATTRIBUTES,
+                      user_id: Optional[str] = None) -> int:
+        mask = self.base_mask
+        group_masks = self.group_masks
+        for group in groups:
+            mask |= group_masks.get(group, 0)
+        if self.rule_flags:
+            user_groups = groups if isinstance(groups, (set, frozenset)) else frozenset(groups)
+            user_hash = stable_hash(user_id) if user_id is not None else None
+            for bit, flag in self.rule_flags:
+                if flag.matches(user_groups, attributes, user_hash):
+                    mask |= 1 << bit
+        return mask
+
+
+def compile_ruleset(db_project: models.Project, environment: models.Environment,
+                    flags: Iterable[schemas.FeatureFlag]) -> Ruleset:
+    compiled = {flag.name: compile_flag(flag) for flag in flags}
+    base_mask = 0
+    group_masks: Dict[str, int] = {}
+    rule_flags = []
+    for bit, flag in enumerate(compiled.values()):
+        if not flag.is_enabled:
+            continue
+        if flag.rules is None:
+            base_mask |= 1 << bit
+        elif len(flag.rules) == 1 and isinstance(flag.rules[0], GroupMatch):
+            for group in flag.rules[0].groups:
+                group_masks[group] = group_masks.get(group, 0) | 1 << bit
+        else:
+            rule_flags.append((bit, flag))
+
+    return Ruleset(
+        project_id=db_project.id,
+        environment=environment,
+        owner_id=db_project.owner_id,
+        flags=MappingProxyType(compiled),
+        names=tuple(compiled),
+        base_mask=base_mask,
+        group_masks=MappingProxyType(group_masks),
+        rule_flags=tuple(rule_flags),
+    )
+
+
+# Bulk evaluation output is NDJSON: a header naming the flag of each bit, then one
+# line per user context whose "on" field is the hex bitmask of enabled flags.
+def bulk_header(ruleset: Ruleset) -> bytes:
+    return json.dumps({
+        "project_id": ruleset.project_id,
+        "environment": ruleset.environment.value,
+        "flags": ruleset.names,
+    }).encode() + b"\n"
+
+
+INVALID_CONTEXT = '{"user_id":null,"error":"invalid context"}'
+
+
+def _result_line(ruleset: Ruleset, context) -> str:
+    # Contexts aren't validated by a schema, so a malformed one must not abort the batch
+    if not isinstance(context, dict):
+        return INVALID_CONTEXT
+    groups = context.get("groups") or []
+    if isinstance(groups, str):
+        groups = [groups]
+    elif not isinstance(groups, list) or not all(isinstance(group, str) for group in groups):
+        return INVALID_CONTEXT
+    attributes = context.get("attributes") or {}
+    if not isinstance(attributes, dict):
+        return INVALID_CONTEXT
+    user_id = context.get("user_id")
+    mask = ruleset.evaluate_mask(groups, attributes, str(user_id) if user_id is not None else None)
+    return '{"user_id":%s,"on":"%x"}' % (json.dumps(user_id), mask)
+
+
+def evaluate_contexts(ruleset: Ruleset, contexts: Iterable) -> bytes:
+    lines = [_result_line(ruleset, context) for context in contexts]
+    return ("\n".join(lines) + "\n").encode() if lines else b""
+
+
+def evaluate_ndjson(ruleset: Ruleset, raw_lines: Iterable[bytes]) -> bytes:
+    lines = []
+    for raw_line in raw_lines:
+        if not raw_line.strip():
+            continue
+        try:
+            context = json.loads(raw_line)
+        except ValueError:
+            context = None
+        lines.append(_result_line(ruleset, context))
+    return ("\n".join(lines) + "\n").encode() if lines else b""
+
+
+class RulesetRegistry:
+    """Process-wide store of compiled rulesets keyed by (project_id, environment).
+
+    Each ruleset remembers the cached flag listing it was compiled from and is
+    recompiled only when ``flag_cache`` hands back a different listing, so it
+    follows the cache's invalidation and TTL. Like the cache it holds at most
+    ``max_entries`` rulesets, evicting the least recently used.
+    """
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self._rulesets: "OrderedDict[Tuple[int, models.Environment], Tuple[tuple, Ruleset]]" = OrderedDict()
+        self.hits = 0
+        self.compiles = 0
+        self.evictions = 0
+
+    async def get(self, db: AsyncSession, project_id: int, environment: models.Environment) -> Optional[Ruleset]:
+        flags = await async_crud.get_project_feature_flags(db, project_id=project_id, environment=environment)
+        compiled = self._rulesets.get((project_id, environment))
+        if compiled is not None and compiled[0] is flags:
+            self._rulesets.move_to_end((project_id, environment))
+            self.hits += 1
+            return compiled[1]
+
+        db_project = await async_crud.get_project(db, project_id=project_id)
+        if db_project is None:
+            return None
+        ruleset = compile_ruleset(db_project, environment, flags)
+        self._store((project_id, environment), flags, ruleset)
+        return ruleset
+
+    def prime(self, db_project: models.Project, environment: models.Environment, flags: tuple):
+        # flags must be the tuple held by flag_cache, so get() recognises it as current
+        self._store((db_project.id, environment), flags, compile_ruleset(db_project, environment, flags))
+
+    def _store(self, key: Tuple[int, models.Environment], flags: tuple, ruleset: Ruleset):
+        self.compiles += 1
+        self._rulesets[key] = (flags, ruleset)
+        self._rulesets.move_to_end(key)
+        while len(self._rulesets) > self.max_entries:
+            self._rulesets.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self._rulesets.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {"entries": len(self._rulesets), "hits": self.hits, "compiles": self.compiles,
+                "evictions": self.evictions}
+
+
+rulesets = RulesetRegistry(max_entries=settings.flag_cache_max_entries)
@@ -1,18 +1,37 @@
-from fastapi import FastAPI
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import Depends, FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
-from .routers import auth, users, projects, feature_flags
-from .database import engine
-from . import models
+from .auth import require_admin
+from .routers import auth, users, projects, feature_flags, evaluation, admin
+from .database import engine, async_engine, pool_stats, async_pool_stats
+from .notifications import start_change_listener, stop_change_listener
+from .revocations import start_revocation_refresh, stop_revocation_refresh
+from .metrics import CONTENT_TYPE, MetricsMiddleware, metrics, render_metrics
+from .profiling import ProfilingMiddleware
+from .warmup import readiness, warm_up
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Nothing here touches the database, so a worker starts even while it is unreachable
+    start_change_listener()
+    start_revocation_refresh()
+    warm_up_task = asyncio.create_task(warm_up())
+    yield
+    warm_up_task.cancel()
+    stop_change_listener()
+    stop_revocation_refresh()
+    await async_engine.dispose()
 
-# Create database tables
-models.Base.metadata.create_all(bind=engine)
 
 app = FastAPI(
     title="Feature Flag API",
     description="A comprehensive feature flag management system with JWT authentication",
     version="1.0.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    lifespan=lifespan
 )
 
 # Add CORS middleware
@@ -23,12 +42,20 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Inside the metrics middleware, whose per-request SQL stats it reads
+app.add_middleware(ProfilingMiddleware)
+# Outermost, so the timings include the other middleware
+app.add_middleware(MetricsMiddleware)
+metrics.instrument_engine(engine)
+metrics.instrument_engine(async_engine.sync_engine)
 
 # Include routers
 app.include_router(auth.router, prefix="/api/v1")
 app.include_router(users.router, prefix="/api/v1")
 app.include_router(projects.router, prefix="/api/v1")
 app.include_router(feature_flags.router, prefix="/api/v1")
+app.include_router(evaluation.router, prefix="/api/v1")
+app.include_router(admin.router, prefix="/api/v1")
 
 
 @app.get("/")
@@ -43,4 +70,24 @@ def read_root():
 
 @app.get("/health")
 def health_check():
-    return {"status": "healthy"} 
\ No newline at end of file
+    return {"status": "healthy"} 
+
+
+@app.get("/ready")
+def readiness_check(response: Response):
+    if not readiness.ready:
+        response.status_code = 503
+    return readiness.report()
+
+
+@app.get("/health/pool", dependencies=[Depends(require_admin)])
+def pool_status():
+    return {
+        "async": async_pool_stats.report(async_engine.pool),
+        "sync": pool_stats.report(engine.pool),
+    }
+
+
+@app.get("/metrics", include_in_schema=False)
+def read_metrics():
+    return Response(content=render_metrics(), media_type=CONTENT_TYPE)
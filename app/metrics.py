@@ -0,0 +1,260 @@
+"""Request, database and cache metrics, exported in the Prometheus text format at /metrics.
+
+Requests are timed by an ASGI middleware and labelled with the matched route
+template, so path parameters don't multiply the series. SQLAlchemy cursor
+events count statements and their time into the current request through a
+context variable, which also follows the async engine's greenlets and
+``run_in_threadpool``. Counters are plain ints and ``Histogram``s updated
+without locks, like the pool telemetry.
+"""
+import time
+from contextvars import ContextVar
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from .telemetry import Histogram
+
+# Statements per request; N+1 patterns land in the upper buckets
+STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 250)
+# Requests that matched no route share one label instead of one per probed path
+UNMATCHED_ROUTE = "unmatched"
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+
+class RequestDatabaseStats:
+    __slots__ = ("statements", "seconds", "queries")
+
+    def __init__(self):
+        self.statements = 0
+        self.seconds = 0.0
+        # statement -> [count, seconds], only while the profiler captures the request
+        self.queries: Optional[Dict[str, list]] = None
+
+
+_request_stats: ContextVar[Optional[RequestDatabaseStats]] = ContextVar("request_database_stats", default=None)
+
+
+def current_request_stats() -> Optional[RequestDatabaseStats]:
+    return _request_stats.get()
+
+
+class RouteMetrics:
+    __slots__ = ("latency", "statements", "db_seconds", "responses")
+
+    def __init__(self):
+        self.latency = Histogram()
+        self.statements = Histogram(STATEMENT_BUCKETS)
+        self.db_seconds = Histogram()
+        self.responses: Dict[int, int] = {}
+
+
+class Metrics:
+    def __init__(self):
+        self.in_flight = 0
+        self.routes: Dict[Tuple[str, str], RouteMetrics] = {}
+        self.statements = 0
+        self.statement_seconds = Histogram()
+
+    def observe_request(self, method: str, route: str, status: int, seconds: float,
+                        database: RequestDatabaseStats):
+        metrics = self.routes.get((method, route))
+        if metrics is None:
+            metrics = self.routes[(method, route)] = RouteMetrics()
+        metrics.latency.observe(seconds)
+        metrics.statements.observe(database.statements)
+        metrics.db_seconds.observe(database.seconds)
+        metrics.responses[status] = metrics.responses.get(status, 0) + 1
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._metrics_started = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, "_metrics_started", None)
+        if started is None:
+            return
+        seconds = time.perf_counter() - started
+        self.statements += 1
+        self.statement_seconds.observe(seconds)
+        stats = _request_stats.get()
+        if stats is not None:
+            stats.statements += 1
+            stats.seconds += seconds
+            if stats.queries is not None:
+                totals = stats.queries.get(statement)
+                if totals is None:
+                    stats.queries[statement] = [1, seconds]
+                else:
+                    totals[0] += 1
+                    totals[1] += seconds
+
+    def instrument_engine(self, engine: Engine):
+        # For the async engine, pass its sync_engine
+        event.listen(engine, "before_cursor_execute", self._before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", self._after_cursor_execute)
+
+
+metrics = Metrics()
+
+
+class MetricsMiddleware:
+    """Times every HTTP request and records its status and database usage per route.
+
+    Event streams are recorded once their headers are sent: they stay open for as
+    long as the client listens, which would otherwise swamp the route's latency and
+    the in-flight gauge. Open streams are counted by ``flag_stream_subscribers``.
+    """
+
+    def __init__(self, app, metrics: Metrics = metrics):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        recorded = False
+
+        def record():
+            nonlocal recorded
+            if recorded:
+                return
+            recorded = True
+            seconds = time.perf_counter() - started
+            self.metrics.in_flight -= 1
+            # The router stores the matched route in the shared scope
+            route = scope.get("route")
+            route_path = getattr(route, "path", UNMATCHED_ROUTE)
+            self.metrics.observe_request(scope["method"], route_path, status, seconds, database)
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if _is_event_stream(message):
+                    record()
+            await send(message)
+
+        database = RequestDatabaseStats()
+        token = _request_stats.set(database)
+        self.metrics.in_flight += 1
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            _request_stats.reset(token)
+            record()
+
+
+def _is_event_stream(message) -> bool:
+    for name, value in message.get("headers", ()):
+        if name.lower() == b"content-type":
+            return value.split(b";")[0].strip().lower() == b"text/event-stream"
+    return False
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(labels: Dict[str, object]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+class _Exposition:
+    def __init__(self):
+        self.lines: List[str] = []
+
+    def family(self, name: str, kind: str, help_text: str):
+        self.lines.append(f"# HELP {name} {help_text}")
+        self.lines.append(f"# TYPE {name} {kind}")
+
+    def sample(self, name: str, value, labels: Optional[Dict[str, object]] = None):
+        self.lines.append(f"{name}{_labels(labels or {})} {value}")
+
+    def histogram(self, name: str, histogram: Histogram, labels: Optional[Dict[str, object]] = None):
+        labels = labels or {}
+        snapshot = histogram.snapshot()
+        for bound, count in snapshot["buckets"].items():
+            self.sample(f"{name}_bucket", count, {**labels, "le": bound})
+        self.sample(f"{name}_sum", snapshot["sum"], labels)
+        self.sample(f"{name}_count", snapshot["count"], labels)
+
+    def simple(self, name: str, kind: str, help_text: str, values: Iterable[Tuple[Dict[str, object], object]]):
+        self.family(name, kind, help_text)
+        for labels, value in values:
+            self.sample(name, value, labels)
+
+    def render(self) -> str:
+        return "\n".join(self.lines) + "\n"
+
+
+def render_metrics(metrics: Metrics = metrics) -> str:
+    from .auth import password_hasher
+    from .cache import flag_cache
+    from .database import async_engine, async_pool_stats, engine, pool_stats
+    from .evaluation import rulesets
+    from .streaming import broadcaster
+
+    out = _Exposition()
+    routes = sorted(metrics.routes.items())
+
+    out.family("http_request_duration_seconds", "histogram", "Request latency by route.")
+    for (method, route), route_metrics in routes:
+        out.histogram("http_request_duration_seconds", route_metrics.latency, {"method": method, "route": route})
+    out.simple("http_requests_total", "counter", "Responses by route and status.", (
+        ({"method": method, "route": route, "status": status}, count)
+        for (method, route), route_metrics in routes
+        for status, count in sorted(route_metrics.responses.items())
+    ))
+    out.simple("http_requests_in_flight", "gauge", "Requests being served.", [({}, metrics.in_flight)])
+    out.family("http_request_db_statements", "histogram", "SQL statements issued per request.")
+    for (method, route), route_metrics in routes:
+        out.histogram("http_request_db_statements", route_metrics.statements, {"method": method, "route": route})
+    out.family("http_request_db_seconds", "histogram", "Time spent in SQL statements per request.")
+    for (method, route), route_metrics in routes:
+        out.histogram("http_request_db_seconds", route_metrics.db_seconds, {"method": method, "route": route})
+
+    out.simple("db_statements_total", "counter", "SQL statements executed, including background work.",
+               [({}, metrics.statements)])
+    out.family("db_statement_duration_seconds", "histogram", "SQL statement latency.")
+    out.histogram("db_statement_duration_seconds", metrics.statement_seconds)
+
+    pools = (("sync", pool_stats, engine.pool), ("async", async_pool_stats, async_engine.pool))
+    out.simple("db_pool_checkouts_total", "counter", "Connections checked out of the pool.",
+               (({"engine": name}, stats.checkouts) for name, stats, _ in pools))
+    out.simple("db_pool_timeouts_total", "counter", "Checkouts that timed out waiting for a connection.",
+               (({"engine": name}, stats.timeouts) for name, stats, _ in pools))
+    out.family("db_pool_wait_seconds", "histogram", "Time spent waiting for a pooled connection.")
+    for name, stats, _ in pools:
+        out.histogram("db_pool_wait_seconds", stats.wait_seconds, {"engine": name})
+    out.simple("db_pool_checked_out", "gauge", "Connections currently checked out.", (
+        ({"engine": name}, pool.checkedout()) for name, _, pool in pools if hasattr(pool, "checkedout")
+    ))
+
+    cache = flag_cache.stats()
+    out.simple("flag_cache_hits_total", "counter", "Flag listing cache hits.", [({}, cache["hits"])])
+    out.simple("flag_cache_misses_total", "counter", "Flag listing cache misses.", [({}, cache["misses"])])
+    out.simple("flag_cache_evictions_total", "counter", "Flag listings evicted.", [({}, cache["evictions"])])
+    out.simple("flag_cache_entries", "gauge", "Cached flag listings.", [({}, cache["entries"])])
+    out.simple("flag_cache_hit_ratio", "gauge", "Flag listing cache hit ratio since start.",
+               [({}, cache["hit_rate"])])
+    compiled = rulesets.stats()
+    out.simple("ruleset_cache_hits_total", "counter", "Evaluations served by an already compiled ruleset.",
+               [({}, compiled["hits"])])
+    out.simple("ruleset_compiles_total", "counter", "Rulesets compiled.", [({}, compiled["compiles"])])
+    out.simple("ruleset_cache_evictions_total", "counter", "Compiled rulesets evicted.",
+               [({}, compiled["evictions"])])
+    out.simple("ruleset_cache_entries", "gauge", "Compiled rulesets held.", [({}, compiled["entries"])])
+
+    hasher = password_hasher.stats()
+    out.simple("password_hash_pending", "gauge", "Password hashes queued or running.", [({}, hasher["pending"])])
+    out.simple("password_hash_rejected_total", "counter", "Authentication requests refused while saturated.",
+               [({}, hasher["rejected"])])
+    out.simple("flag_stream_subscribers", "gauge", "Open flag change streams.",
+               [({}, broadcaster.subscriber_count)])
+    return out.render()
@@ -1,9 +1,13 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Text, Enum
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Text, Enum, JSON, Index, UniqueConstraint
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 import enum
 from .database import Base
 
+# Named so duplicate-flag errors can be told apart from other integrity errors
+FLAG_UNIQUE_CONSTRAINT = "uq_feature_flags_project_name_environment"
+
 
 class UserRole(str, enum.Enum):
     ADMIN = "admin"
@@ -25,6 +29,8 @@ class User(Base):
     hashed_password = Column(String, nullable=False)
     role = Column(Enum(UserRole), nullable=False, default=UserRole.DEVELOPER)
     is_active = Column(Boolean, default=True)
+    # Bumped whenever previously issued tokens must stop working
+    token_version = Column(Integer, nullable=False, default=0, server_default="0")
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
@@ -47,6 +53,11 @@ class Project(Base):
     owner = relationship("User", back_populates="projects")
     feature_flags = relationship("FeatureFlag", back_populates="project")
 
+    __table_args__ = (
+        # Owner-scoped listings filter on owner_id and page by id
+        Index("ix_projects_owner_id", "owner_id", "id"),
+    )
+
 
 class FeatureFlag(Base):
     __tablename__ = "feature_flags"
@@ -58,10 +69,46 @@ class FeatureFlag(Base):
     environment = Column(Enum(Environment), nullable=False)
     project_id = Column(Integer, ForeignKey("projects.id"), nullable=False)
     created_by_id = Column(Integer, ForeignKey("users.id"), nullable=False)
-    user_group_targeting = Column(String)  # JSON string for user group targeting
+    # schemas.Targeting rules
+    user_group_targeting = Column(JSON(none_as_null=True).with_variant(JSONB(none_as_null=True), "postgresql"))
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    # Set on insert too, so it is the watermark for the changes feed
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
 
     # Relationships
     project = relationship("Project", back_populates="feature_flags")
-    created_by = relationship("User", back_populates="feature_flags") 
\ No newline at end of file
+    created_by = relationship("User", back_populates="feature_flags")
+
+    __table_args__ = (
+        # Also serves the (project_id, name) lookups
+        UniqueConstraint("project_id", "name", "environment", name=FLAG_UNIQUE_CONSTRAINT),
+        Index("ix_feature_flags_project_environment", "project_id", "environment", "id"),
+        Index("ix_feature_flags_project_updated_at", "project_id", "updated_at"),
+    )
+
+
+class FeatureFlagDeletion(Base):
+    """Tombstones for the changes feed, kept for FLAG_DELETION_RETENTION_DAYS."""
+
+    __tablename__ = "feature_flag_deletions"
+
+    id = Column(Integer, primary_key=True)
+    # No foreign keys: the flag, and possibly its project, are gone
+    flag_id = Column(Integer, nullable=False)
+    project_id = Column(Integer, nullable=False)
+    name = Column(String, nullable=False)
+    environment = Column(Enum(Environment), nullable=False)
+    deleted_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+    __table_args__ = (
+        Index("ix_feature_flag_deletions_project_deleted_at", "project_id", "deleted_at"),
+    )
+
+
+class TokenRevocation(Base):
+    __tablename__ = "token_revocations"
+
+    # No foreign key: rows must outlive deleted users until their tokens expire
+    user_id = Column(Integer, primary_key=True)
+    min_token_version = Column(Integer, nullable=False)
+    revoked_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
@@ -0,0 +1,223 @@
+import json
+import logging
+import select
+import threading
+import uuid
+from typing import Callable, List, NamedTuple, Optional
+from sqlalchemy import Text, bindparam, create_engine, text
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.pool import NullPool
+from sqlalchemy.orm import Session
+from .cache import flag_cache
+from .config import settings
+from .database import engine
+from .models import Environment
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "feature_flag_changes"
+
+# Postgres rejects NOTIFY payloads of 8000 bytes or more
+MAX_PAYLOAD_BYTES = 7900
+
+NOTIFY = text("SELECT pg_notify(:channel, :payload)")
+NOTIFY_MANY = text("SELECT pg_notify(:channel, payload) FROM unnest(:payloads) AS payload").bindparams(
+    bindparam("payloads", type_=ARRAY(Text))
+)
+
+# Identifies this worker so the listener can skip changes it already applied locally
+ORIGIN = uuid.uuid4().hex
+
+
+class FlagChange(NamedTuple):
+    project_id: int
+    # None when every environment of the project is affected
+    environment: Optional[Environment]
+    version: int
+    # "created", "updated" or "deleted"; None when only the affected scope is known
+    event: Optional[str] = None
+    flag: Optional[dict] = None
+    # Where the flag was before an update, which may have moved it to another environment
+    previous_environment: Optional[Environment] = None
+
+
+_change_handlers: List[Callable[[FlagChange], None]] = []
+
+
+def add_change_handler(handler: Callable[[FlagChange], None]):
+    _change_handlers.append(handler)
+
+
+def _dispatch(change: FlagChange):
+    for handler in _change_handlers:
+        try:
+            handler(change)
+        except Exception:
+            logger.exception("Flag change handler %r failed", handler)
+
+
+def _encode(change: FlagChange) -> str:
+    payload = json.dumps({
+        "origin": ORIGIN,
+        "project_id": change.project_id,
+        "environment": change.environment.value if change.environment is not None else None,
+        "version": change.version,
+        "event": change.event,
+        "flag": change.flag,
+        "previous_environment": (
+            change.previous_environment.value if change.previous_environment is not None else None
+        ),
+    })
+    if len(payload.encode()) > MAX_PAYLOAD_BYTES:
+        # Receivers fall back to reloading the scope when the flag is missing
+        return _encode(change._replace(flag=None))
+    return payload
+
+
+def publish_flag_change(db: Session, change: FlagChange):
+    _dispatch(change)
+    bind = db.get_bind()
+    if bind.dialect.name != "postgresql":
+        return
+    payload = _encode(change)
+    # Sent on its own connection so committing it doesn't expire the caller's session
+    try:
+        with bind.connect() as connection:
+            connection.execute(NOTIFY, {"channel": CHANNEL, "payload": payload})
+            connection.commit()
+    except SQLAlchemyError:
+        # The write itself is committed; other workers fall back to the cache TTL
+        logger.exception("Failed to publish flag change for project %s", change.project_id)
+
+
+async def publish_flag_change_async(db: AsyncSession, change: FlagChange):
+    _dispatch(change)
+    if db.bind.dialect.name != "postgresql":
+        return
+    try:
+        # Sessions don't expire on commit, so committing here leaves the caller's objects loaded
+        await db.execute(NOTIFY, {"channel": CHANNEL, "payload": _encode(change)})
+        await db.commit()
+    except SQLAlchemyError:
+        logger.exception("Failed to publish flag change for project %s", change.project_id)
+
+
+async def publish_flag_changes_async(db: AsyncSession, changes: List[FlagChange]):
+    # One round trip for a whole batch; each change is still its own notification
+    for change in changes:
+        _dispatch(change)
+    if not changes or db.bind.dialect.name != "postgresql":
+        return
+    try:
+        await db.execute(NOTIFY_MANY, {"channel": CHANNEL, "payloads": [_encode(change) for change in changes]})
+        await db.commit()
+    except SQLAlchemyError:
+        logger.exception("Failed to publish %d flag changes", len(changes))
+
+
+def apply_flag_change(payload: str):
+    try:
+        change = json.loads(payload)
+        project_id = int(change["project_id"])
+        environment = Environment(change["environment"]) if change.get("environment") else None
+        previous = change.get("previous_environment")
+        previous_environment = Environment(previous) if previous else None
+    except (ValueError, KeyError, TypeError):
+        logger.warning("Ignoring malformed flag change notification: %r", payload)
+        return
+    if change.get("origin") == ORIGIN:
+        return
+    version = flag_cache.invalidate(project_id, environment)
+    _dispatch(FlagChange(
+        project_id, environment, version, change.get("event"), change.get("flag"), previous_environment
+    ))
+
+
+class ChangeListener:
+    """Background thread that LISTENs for flag changes made by other workers.
+
+    The listener owns one connection detached from the engine's pool. Whenever it
+    (re)connects it drops the whole local cache, since notifications sent while it
+    was not listening are lost.
+    """
+
+    def __init__(self, bind: Engine, channel: str = CHANNEL, poll_interval: float = 5.0,
+                 retry_interval: float = 1.0):
+        self.bind = bind
+        self.channel = channel
+        self.poll_interval = poll_interval
+        self.retry_interval = retry_interval
+        self._stopped = threading.Event()
+        # Set while LISTEN is active; caches filled before that may miss changes
+        self.listening = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.bind.dialect.name != "postgresql":
+            logger.info("Flag change notifications need PostgreSQL; listener not started")
+            return
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name="flag-change-listener", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.poll_interval + 1)
+            self._thread = None
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                self._listen()
+            except Exception:
+                logger.exception("Flag change listener lost its connection; retrying")
+                self._stopped.wait(self.retry_interval)
+
+    def _listen(self):
+        connection = self.bind.raw_connection()
+        # Keep the long-lived LISTEN connection out of the request pool
+        connection.detach()
+        dbapi_connection = connection.dbapi_connection
+        try:
+            dbapi_connection.autocommit = True
+            with dbapi_connection.cursor() as cursor:
+                cursor.execute(f'LISTEN "{self.channel}"')
+            flag_cache.invalidate_all()
+            self.listening.set()
+
+            while not self._stopped.is_set():
+                readable, _, _ = select.select([dbapi_connection], [], [], self.poll_interval)
+                if not readable:
+                    continue
+                dbapi_connection.poll()
+                while dbapi_connection.notifies:
+                    notification = dbapi_connection.notifies.pop(0)
+                    apply_flag_change(notification.payload)
+        finally:
+            self.listening.clear()
+            connection.close()
+
+
+# LISTEN needs a session-pooled connection, which PgBouncer transaction mode can't provide
+change_listener = ChangeListener(
+    create_engine(settings.listen_database_url, poolclass=NullPool) if settings.listen_database_url else engine
+)
+
+
+def start_change_listener():
+    if settings.flag_change_notifications:
+        change_listener.start()
+
+
+def stop_change_listener():
+    change_listener.stop()
@@ -0,0 +1,35 @@
+import base64
+import json
+from typing import Optional, Sequence
+from fastapi import HTTPException, Request, Response
+
+
+# Listings are ordered by id, so a cursor only needs the last id already returned.
+# It is wrapped in base64 JSON to stay opaque and leave room for other sort keys.
+def encode_cursor(last_id: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps({"id": last_id}).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[int]:
+    if not cursor:
+        return None
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        last_id = payload["id"]
+    except (ValueError, TypeError, KeyError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(last_id, int):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return last_id
+
+
+def set_next_cursor(request: Request, response: Response, items: Sequence, limit: int):
+    # A short page is the last one
+    if not items or len(items) < limit:
+        return
+    last = items[-1]
+    # Items are ORM objects or schemas, or plain row dicts on the serialization fast path
+    cursor = encode_cursor(last["id"] if isinstance(last, dict) else last.id)
+    next_url = request.url.remove_query_params("skip").include_query_params(cursor=cursor)
+    response.headers["X-Next-Cursor"] = cursor
+    response.headers["Link"] = f'<{next_url}>; rel="next"'
@@ -0,0 +1,295 @@
+"""On-demand stack sampling and slow-request capture for admins.
+
+A sampler thread reads every thread's stack with ``sys._current_frames()``
+and counts them as collapsed stacks (``frame;frame;frame count``), the input
+format of flamegraph.pl and speedscope. It only runs while something wants
+samples: a timed profile, a request carrying the issued ``X-Profile`` key, or
+a request that has exceeded the slow-request threshold. With none of those
+configured the middleware costs one attribute check per request.
+
+Samples cover all threads, so under concurrency a request's profile also
+shows the other requests that were running on the event loop at the time.
+"""
+import asyncio
+import itertools
+import os
+import secrets
+import sys
+import sysconfig
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, List, Optional, Set
+from .config import settings
+from .metrics import RequestDatabaseStats, current_request_stats
+
+PROFILE_HEADER = "X-Profile"
+MAX_CAPTURES = 50
+TOP_QUERIES = 20
+
+_STDLIB = sysconfig.get_paths()["stdlib"] + os.sep
+_frame_labels: Dict[Any, str] = {}
+
+
+def _frame_label(code) -> str:
+    label = _frame_labels.get(code)
+    if label is None:
+        filename = code.co_filename
+        # Keep labels short and stable across machines
+        marker = filename.rfind("site-packages" + os.sep)
+        if marker != -1:
+            filename = filename[marker + len("site-packages") + 1:]
+        elif filename.startswith(_STDLIB):
+            filename = filename[len(_STDLIB):]
+        elif filename.startswith(os.getcwd()):
+            filename = os.path.relpath(filename)
+        label = _frame_labels[code] = f"{code.co_name} ({filename}:{code.co_firstlineno})"
+    return label
+
+
+def collapse(thread_name: str, frame) -> str:
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame.f_code))
+        frame = frame.f_back
+    labels.append(thread_name)
+    labels.reverse()
+    return ";".join(labels)
+
+
+class Profile:
+    __slots__ = ("counts", "samples", "started")
+
+    def __init__(self):
+        self.counts: Counter = Counter()
+        self.samples = 0
+        self.started = time.time()
+
+    def add(self, stacks: List[str]):
+        self.counts.update(stacks)
+        self.samples += 1
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.counts.most_common())
+
+
+class InFlightRequest:
+    __slots__ = ("method", "path", "reason", "started", "started_at", "database", "profile")
+
+    def __init__(self, method: str, path: str, reason: Optional[str], database: Optional[RequestDatabaseStats]):
+        self.method = method
+        self.path = path
+        self.reason = reason
+        self.started = time.perf_counter()
+        self.started_at = datetime.now(timezone.utc)
+        self.database = database
+        self.profile: Optional[Profile] = None
+
+
+class Profiler:
+    def __init__(self, interval: float, slow_threshold: Optional[float]):
+        self.interval = interval
+        self.slow_threshold = slow_threshold
+        self.header_key: Optional[str] = None
+        self.header_key_expires = 0.0
+        self.captures: Deque[Dict[str, Any]] = deque(maxlen=MAX_CAPTURES)
+        self._capture_ids = itertools.count(1)
+        self._profiles: Set[Profile] = set()
+        self._in_flight: Set[InFlightRequest] = set()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.slow_threshold is not None or self.header_key is not None
+
+    # Sampler thread
+    def _start_sampler(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        me = threading.get_ident()
+        while True:
+            with self._lock:
+                slow_threshold = self.slow_threshold
+                if not self._profiles and slow_threshold is None:
+                    self._thread = None
+                    return
+                in_flight = list(self._in_flight) if slow_threshold is not None else ()
+
+            now = time.perf_counter()
+            for request in in_flight:
+                if request.profile is None and now - request.started >= slow_threshold:
+                    with self._lock:
+                        # Unless it finished in the meantime
+                        if request in self._in_flight:
+                            request.profile = Profile()
+                            self._profiles.add(request.profile)
+
+            with self._lock:
+                profiles = list(self._profiles)
+            if profiles:
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+                stacks = [
+                    collapse(names.get(ident, str(ident)), frame)
+                    for ident, frame in sys._current_frames().items()
+                    if ident != me
+                ]
+                for profile in profiles:
+                    profile.add(stacks)
+                time.sleep(self.interval)
+            elif slow_threshold is not None:
+                # Only watching for slow requests; a quarter of the threshold is precise enough
+                time.sleep(min(max(slow_threshold / 4, self.interval), 0.25))
+
+    def _track(self, profile: Profile):
+        with self._lock:
+            self._profiles.add(profile)
+        self._start_sampler()
+
+    def _untrack(self, profile: Optional[Profile]):
+        if profile is not None:
+            with self._lock:
+                self._profiles.discard(profile)
+
+    # Timed profiles
+    async def profile_for(self, seconds: float) -> Profile:
+        profile = Profile()
+        self._track(profile)
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            self._untrack(profile)
+        return profile
+
+    # Header-triggered profiles
+    def issue_header_key(self, seconds: float) -> str:
+        self.header_key = secrets.token_urlsafe(24)
+        self.header_key_expires = time.time() + seconds
+        return self.header_key
+
+    def revoke_header_key(self):
+        self.header_key = None
+
+    def header_matches(self, value: Optional[bytes]) -> bool:
+        key = self.header_key
+        if key is None or value is None:
+            return False
+        if time.time() >= self.header_key_expires:
+            self.header_key = None
+            return False
+        return secrets.compare_digest(value, key.encode())
+
+    # Slow requests
+    def set_slow_threshold(self, threshold_ms: Optional[int]):
+        self.slow_threshold = threshold_ms / 1000 if threshold_ms is not None else None
+        if self.slow_threshold is not None:
+            self._start_sampler()
+
+    def begin(self, request: InFlightRequest):
+        if request.reason == "header":
+            request.profile = Profile()
+            self._track(request.profile)
+        with self._lock:
+            self._in_flight.add(request)
+        if self.slow_threshold is not None:
+            self._start_sampler()
+
+    def finish(self, request: InFlightRequest, route: Optional[str], status: int):
+        with self._lock:
+            self._in_flight.discard(request)
+            self._profiles.discard(request.profile)
+        seconds = time.perf_counter() - request.started
+        reason = request.reason
+        if reason is None:
+            if self.slow_threshold is None or seconds < self.slow_threshold:
+                return
+            reason = "slow"
+        self.captures.append(self._capture(request, route, status, seconds, reason))
+
+    def _capture(self, request: InFlightRequest, route: Optional[str], status: int,
+                 seconds: float, reason: str) -> Dict[str, Any]:
+        database = request.database
+        queries = []
+        if database is not None and database.queries:
+            ranked = sorted(database.queries.items(), key=lambda item: item[1][1], reverse=True)
+            queries = [
+                {"statement": statement, "count": count, "total_ms": total * 1000}
+                for statement, (count, total) in ranked[:TOP_QUERIES]
+            ]
+        profile = request.profile
+        return {
+            "id": next(self._capture_ids),
+            "reason": reason,
+            "method": request.method,
+            "path": request.path,
+            "route": route,
+            "status": status,
+            "started_at": request.started_at.isoformat(),
+            "duration_ms": seconds * 1000,
+            "statements": database.statements if database is not None else None,
+            "db_ms": database.seconds * 1000 if database is not None else None,
+            "queries": queries,
+            "samples": profile.samples if profile is not None else 0,
+            "stacks": profile.collapsed() if profile is not None else "",
+        }
+
+    def get_capture(self, capture_id: int) -> Optional[Dict[str, Any]]:
+        for capture in self.captures:
+            if capture["id"] == capture_id:
+                return capture
+        return None
+
+
+profiler = Profiler(
+    interval=settings.profile_sample_interval_ms / 1000,
+    slow_threshold=settings.slow_request_ms / 1000 if settings.slow_request_ms is not None else None,
+)
+
+
+class ProfilingMiddleware:
+    """Tracks requests for the profiler; passes straight through while it is disabled."""
+
+    def __init__(self, app, profiler: Profiler = profiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        profiler = self.profiler
+        if scope["type"] != "http" or not profiler.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        reason = None
+        if profiler.header_key is not None:
+            header = PROFILE_HEADER.lower().encode()
+            value = next((value for name, value in scope["headers"] if name == header), None)
+            if profiler.header_matches(value):
+                reason = "header"
+        if reason is None and profiler.slow_threshold is None:
+            await self.app(scope, receive, send)
+            return
+
+        database = current_request_stats()
+        if database is not None:
+            # Per-statement totals, for the SQL breakdown of a capture
+            database.queries = {}
+        request = InFlightRequest(scope["method"], scope["path"], reason, database)
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        profiler.begin(request)
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = getattr(scope.get("route"), "path", None)
+            profiler.finish(request, route, status)
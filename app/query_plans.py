@@ -0,0 +1,75 @@
+"""Checks that the hot lookup queries are planned as index scans.
+
+Run against a migrated database with ``python -m app.query_plans``; it exits
+non-zero when any of them would scan a whole table. On PostgreSQL sequential
+scans are disabled for the check, so small tables report the plan that a
+large one would get. Other databases are reported as unsupported and skipped.
+"""
+import sys
+from typing import Dict, List, Tuple
+from sqlalchemy import func, select
+from sqlalchemy.engine import Connection, Engine
+from .models import Environment, FeatureFlag, FeatureFlagDeletion, Project
+
+SUPPORTED_DIALECTS = ("postgresql", "sqlite")
+
+HOT_QUERIES = {
+    "project flags by environment": select(FeatureFlag)
+    .where(FeatureFlag.project_id == 1, FeatureFlag.environment == Environment.PROD)
+    .order_by(FeatureFlag.id),
+    "flag by project and name": select(FeatureFlag)
+    .where(FeatureFlag.project_id == 1, FeatureFlag.name == "new_ui"),
+    "projects by owner": select(Project)
+    .where(Project.owner_id == 1)
+    .order_by(Project.id),
+    "flag changes since watermark": select(FeatureFlag)
+    .where(FeatureFlag.project_id == 1, FeatureFlag.updated_at >= func.now())
+    .order_by(FeatureFlag.updated_at, FeatureFlag.id),
+    "deletions since watermark": select(FeatureFlagDeletion)
+    .where(FeatureFlagDeletion.project_id == 1, FeatureFlagDeletion.deleted_at >= func.now()),
+}
+
+
+def explain(connection: Connection, statement) -> List[str]:
+    sql = str(statement.compile(dialect=connection.dialect, compile_kwargs={"literal_binds": True}))
+    if connection.dialect.name == "postgresql":
+        connection.exec_driver_sql("SET LOCAL enable_seqscan = off")
+        return [row[0] for row in connection.exec_driver_sql("EXPLAIN " + sql)]
+    return [row[3] for row in connection.exec_driver_sql("EXPLAIN QUERY PLAN " + sql)]
+
+
+def uses_index(connection: Connection, plan: List[str]) -> bool:
+    if connection.dialect.name == "postgresql":
+        return not any("Seq Scan" in line for line in plan)
+    # SQLite: "SCAN <table>" without an index is a full table scan
+    return not any(line.startswith("SCAN") and "INDEX" not in line for line in plan)
+
+
+def check_query_plans(engine: Engine) -> Dict[str, Tuple[bool, List[str]]]:
+    # Only for SUPPORTED_DIALECTS
+    results = {}
+    with engine.connect() as connection:
+        for name, statement in HOT_QUERIES.items():
+            with connection.begin():
+                plan = explain(connection, statement)
+                results[name] = (uses_index(connection, plan), plan)
+    return results
+
+
+def main() -> int:
+    from .database import engine
+
+    if engine.dialect.name not in SUPPORTED_DIALECTS:
+        print(f"unsupported dialect {engine.dialect.name}, skipped")
+        return 0
+    failed = False
+    for name, (ok, plan) in check_query_plans(engine).items():
+        failed = failed or not ok
+        print(f"{'ok  ' if ok else 'SCAN'} {name}")
+        for line in plan:
+            print(f"       {line}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,89 @@
+import logging
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional, Tuple
+from .config import settings
+from .database import SessionLocal
+from .models import TokenRevocation
+
+logger = logging.getLogger(__name__)
+
+
+class RevocationCache:
+    """In-memory copy of the token_revocations table used by stateless auth.
+
+    A token is revoked when its ``ver`` claim is below the user's recorded
+    minimum. The table only holds users whose tokens were revoked within the
+    token lifetime, so the whole of it is reloaded on every refresh.
+    """
+
+    def __init__(self, refresh_interval: float = 30):
+        self.refresh_interval = refresh_interval
+        self.loaded = False
+        self._min_versions: Dict[int, int] = {}
+        # Revocations made by this worker, kept until a refresh is sure to include them
+        self._local: Dict[int, Tuple[int, float]] = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def is_revoked(self, user_id: int, token_version: int) -> bool:
+        return token_version < self._min_versions.get(user_id, 0)
+
+    def record(self, user_id: int, min_token_version: int):
+        with self._lock:
+            self._local[user_id] = (min_token_version, time.monotonic())
+            self._min_versions[user_id] = max(self._min_versions.get(user_id, 0), min_token_version)
+
+    def refresh(self):
+        started = time.monotonic()
+        cutoff = datetime.now(timezone.utc) - timedelta(minutes=settings.access_token_expire_minutes)
+        with SessionLocal() as db:
+            # Tokens issued before the cutoff have expired, so older rows no longer matter
+            db.query(TokenRevocation).filter(TokenRevocation.revoked_at < cutoff).delete()
+            db.commit()
+            rows = db.query(TokenRevocation.user_id, TokenRevocation.min_token_version).all()
+
+        min_versions = {user_id: version for user_id, version in rows}
+        with self._lock:
+            for user_id, (version, recorded_at) in list(self._local.items()):
+                if recorded_at < started - self.refresh_interval:
+                    del self._local[user_id]
+                else:
+                    min_versions[user_id] = max(min_versions.get(user_id, 0), version)
+            self._min_versions = min_versions
+            self.loaded = True
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name="token-revocation-refresh", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                self.refresh()
+            except Exception:
+                logger.exception("Failed to refresh token revocations")
+            self._stopped.wait(self.refresh_interval)
+
+
+revocations = RevocationCache(refresh_interval=settings.revocation_refresh_seconds)
+
+
+def start_revocation_refresh():
+    if settings.stateless_auth:
+        revocations.start()
+
+
+def stop_revocation_refresh():
+    revocations.stop()
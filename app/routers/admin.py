@@ -0,0 +1,68 @@
+from typing import Any, Dict, List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from ..auth import require_admin
+from ..models import User as UserModel
+from ..profiling import PROFILE_HEADER, profiler
+
+router = APIRouter(prefix="/admin", tags=["admin"])
+
+COLLAPSED_MEDIA_TYPE = "text/plain"
+
+
+@router.post("/profile", response_class=Response)
+async def profile(
+    seconds: float = Query(10, gt=0, le=120),
+    current_user: UserModel = Depends(require_admin)
+):
+    # Returns collapsed stacks for flamegraph.pl or speedscope
+    result = await profiler.profile_for(seconds)
+    return Response(content=result.collapsed(), media_type=COLLAPSED_MEDIA_TYPE)
+
+
+@router.post("/profile/header")
+def issue_profile_header(
+    seconds: int = Query(300, gt=0, le=3600),
+    current_user: UserModel = Depends(require_admin)
+):
+    key = profiler.issue_header_key(seconds)
+    return {"header": PROFILE_HEADER, "value": key, "expires_in": seconds}
+
+
+@router.delete("/profile/header")
+def revoke_profile_header(current_user: UserModel = Depends(require_admin)):
+    profiler.revoke_header_key()
+    return {"message": "Profiling header revoked"}
+
+
+@router.put("/profile/slow-requests")
+def set_slow_request_threshold(
+    threshold_ms: Optional[int] = Query(None, gt=0, description="Omit to stop capturing slow requests"),
+    current_user: UserModel = Depends(require_admin)
+):
+    profiler.set_slow_threshold(threshold_ms)
+    return {"threshold_ms": threshold_ms}
+
+
+@router.get("/profile/captures")
+def read_captures(current_user: UserModel = Depends(require_admin)) -> List[Dict[str, Any]]:
+    # Newest first, without the stacks
+    return [
+        {key: value for key, value in capture.items() if key != "stacks"}
+        for capture in reversed(profiler.captures)
+    ]
+
+
+@router.get("/profile/captures/{capture_id}")
+def read_capture(capture_id: int, current_user: UserModel = Depends(require_admin)):
+    capture = profiler.get_capture(capture_id)
+    if capture is None:
+        raise HTTPException(status_code=404, detail="Capture not found")
+    return capture
+
+
+@router.get("/profile/captures/{capture_id}/stacks", response_class=Response)
+def read_capture_stacks(capture_id: int, current_user: UserModel = Depends(require_admin)):
+    capture = profiler.get_capture(capture_id)
+    if capture is None:
+        raise HTTPException(status_code=404, detail="Capture not found")
+    return Response(content=capture["stacks"], media_type=COLLAPSED_MEDIA_TYPE)
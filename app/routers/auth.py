@@ -1,10 +1,13 @@
 from datetime import timedelta
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
-from ..database import get_db
-from ..auth import authenticate_user, create_access_token, get_current_active_user
-from ..crud import create_user, get_user_by_email, get_user_by_username
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..database import get_async_db
+from ..auth import (
+    authenticate_user, create_access_token, get_current_active_user, token_claims,
+    TokenUser, password_hasher
+)
+from ..async_crud import create_user, get_user, get_user_by_email, get_user_by_username
 from ..schemas import UserCreate, Token, User
 from ..config import settings
 
@@ -12,31 +15,33 @@ router = APIRouter(prefix="/auth", tags=["authentication"])
 
 
 @router.post("/signup", response_model=User)
-def signup(user: UserCreate, db: Session = Depends(get_db)):
+async def signup(user: UserCreate, db: AsyncSession = Depends(get_async_db)):
     # Check if user already exists
-    db_user = get_user_by_email(db, email=user.email)
+    db_user = await get_user_by_email(db, email=user.email)
     if db_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Email already registered"
         )
     
-    db_user = get_user_by_username(db, username=user.username)
+    db_user = await get_user_by_username(db, username=user.username)
     if db_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Username already taken"
         )
     
-    return create_user(db=db, user=user)
+    # bcrypt runs on the password pool, not the request threadpool
+    hashed_password = await password_hasher.hash(user.password)
+    return await create_user(db=db, user=user, hashed_password=hashed_password)
 
 
 @router.post("/token", response_model=Token)
-def login_for_access_token(
+async def login_for_access_token(
     form_data: OAuth2PasswordRequestForm = Depends(),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    user = authenticate_user(db, form_data.username, form_data.password)
+    user = await authenticate_user(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -46,11 +51,20 @@ def login_for_access_token(
     
     access_token_expires = timedelta(minutes=settings.access_token_expire_minutes)
     access_token = create_access_token(
-        data={"sub": user.username}, expires_delta=access_token_expires
+        data=token_claims(user), expires_delta=access_token_expires
     )
     return {"access_token": access_token, "token_type": "bearer"}
 
 
 @router.get("/me", response_model=User)
-def read_users_me(current_user: User = Depends(get_current_active_user)):
+async def read_users_me(
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    # Stateless tokens only carry the claims needed for authorization
+    if isinstance(current_user, TokenUser):
+        db_user = await get_user(db, user_id=current_user.id)
+        if db_user is None:
+            raise HTTPException(status_code=404, detail="User not found")
+        return db_user
     return current_user 
\ No newline at end of file
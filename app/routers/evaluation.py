@@ -0,0 +1,116 @@
+import json
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from starlette.requests import ClientDisconnect
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..database import get_async_db
+from ..auth import get_current_active_user
+from ..evaluation import bulk_header, evaluate_contexts, evaluate_ndjson, rulesets
+from ..schemas import EvaluationRequest, EvaluationResult
+from ..models import Environment, User as UserModel
+
+router = APIRouter(prefix="/evaluate", tags=["evaluation"])
+
+# User contexts evaluated per worker-thread hop in bulk requests
+BULK_BATCH_SIZE = 5000
+
+
+class RequestStreamingResponse(StreamingResponse):
+    """A streaming response whose body iterator is still reading the request.
+
+    StreamingResponse watches ``receive`` for a disconnect while it streams,
+    which would swallow the request body chunks; here the iterator reads them
+    and sees a disconnect as ``ClientDisconnect`` instead.
+    """
+
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+
+@router.post("", response_model=EvaluationResult)
+async def evaluate_flags(
+    request: EvaluationRequest,
+    current_user: UserModel = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    # Served from the compiled ruleset; the DB is only touched on a cold key
+    ruleset = await rulesets.get(db, project_id=request.project_id, environment=request.environment)
+    if ruleset is None:
+        raise HTTPException(status_code=404, detail="Project not found")
+
+    if current_user.role != "admin" and ruleset.owner_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+
+    return {
+        "project_id": ruleset.project_id,
+        "environment": ruleset.environment,
+        "flags": ruleset.evaluate(
+            request.user.groups, request.flags, request.user.attributes, request.user.user_id
+        ),
+    }
+
+
+@router.post("/bulk", response_class=StreamingResponse)
+async def bulk_evaluate_flags(
+    request: Request,
+    project_id: int = Query(...),
+    environment: Environment = Query(...),
+    current_user: UserModel = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Evaluate many user contexts against one ruleset.
+
+    The body is either NDJSON (one ``{"user_id", "groups", "attributes"}`` context per line)
+    or JSON ``{"users": [...]}``. The NDJSON response starts with the flag names
+    and has one ``{"user_id", "on"}`` line per context, where ``on`` is the hex
+    bitmask of enabled flags.
+    """
+    ruleset = await rulesets.get(db, project_id=project_id, environment=environment)
+    if ruleset is None:
+        raise HTTPException(status_code=404, detail="Project not found")
+
+    if current_user.role != "admin" and ruleset.owner_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+
+    # Reading a large body can take a while; don't hold a pooled connection for it
+    await db.close()
+
+    if request.headers.get("content-type", "").startswith("application/json"):
+        try:
+            payload = json.loads(await request.body())
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid JSON body")
+        users = payload.get("users") if isinstance(payload, dict) else payload
+        if not isinstance(users, list):
+            raise HTTPException(status_code=400, detail="Expected a list of user contexts")
+
+        async def results():
+            yield bulk_header(ruleset)
+            for start in range(0, len(users), BULK_BATCH_SIZE):
+                batch = users[start:start + BULK_BATCH_SIZE]
+                yield await run_in_threadpool(evaluate_contexts, ruleset, batch)
+
+        return StreamingResponse(results(), media_type="application/x-ndjson")
+
+    async def results():
+        # NDJSON is evaluated as it arrives, so the raw body is never held whole and
+        # the first results go out before the last contexts are read
+        yield bulk_header(ruleset)
+        pending = b""
+        lines = []
+        try:
+            async for data in request.stream():
+                *complete, pending = (pending + data).split(b"\n")
+                lines.extend(complete)
+                if len(lines) >= BULK_BATCH_SIZE:
+                    yield await run_in_threadpool(evaluate_ndjson, ruleset, lines)
+                    lines = []
+        except ClientDisconnect:
+            return
+        lines.append(pending)
+        yield await run_in_threadpool(evaluate_ndjson, ruleset, lines)
+
+    return RequestStreamingResponse(results(), media_type="application/x-ndjson")
@@ -1,147 +1,381 @@
+from bisect import bisect_right
+from datetime import datetime, timedelta, timezone
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session
-from ..database import get_db
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Header, Request, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..database import get_async_db
 from ..auth import get_current_active_user
-from ..crud import (
-    get_feature_flags, get_feature_flag, create_feature_flag, 
+from ..async_crud import (
+    get_feature_flag_rows, get_feature_flag, get_feature_flag_with_owner, create_feature_flag, 
     update_feature_flag, delete_feature_flag, get_project,
-    get_feature_flag_by_name_and_project
+    get_project_flag_listing, get_database_time, get_flag_changes,
+    get_project_owners, get_existing_flag_ids, create_feature_flags, update_feature_flags,
+    set_feature_flags_enabled
 )
-from ..schemas import FeatureFlag, FeatureFlagCreate, FeatureFlagUpdate
-from ..models import User as UserModel, Environment
+from ..config import settings
+from ..conditional import etag_matches, not_modified, set_etag, variant_etag
+from ..pagination import decode_cursor, set_next_cursor
+from ..serialization import models_response, rows_response
+from ..streaming import broadcaster, load_snapshot, stream_flag_changes
+from ..schemas import (
+    FeatureFlag, FeatureFlagCreate, FeatureFlagUpdate, FlagChanges,
+    FeatureFlagBulkCreate, FeatureFlagBulkUpdate, FeatureFlagBulkToggle, BulkFlagResponse
+)
+from ..models import FLAG_UNIQUE_CONSTRAINT, User as UserModel, Environment
 
 router = APIRouter(prefix="/feature-flags", tags=["feature flags"])
 
+DUPLICATE_FLAG_DETAIL = "Feature flag with this name already exists in this project and environment"
+UNIQUE_VIOLATION = "23505"
+# SQLite reports the columns instead of the constraint name
+SQLITE_DUPLICATE_FLAG = (
+    "UNIQUE constraint failed: feature_flags.project_id, feature_flags.name, feature_flags.environment"
+)
+
+
+def _owner_filter(current_user: UserModel) -> Optional[int]:
+    # Owner to restrict access-checked statements to; admins see every project
+    return None if current_user.role == "admin" else current_user.id
+
+
+def _is_duplicate_flag(error: IntegrityError) -> bool:
+    # Other integrity errors (a project deleted meanwhile, a NULL) aren't duplicates
+    orig = error.orig
+    if getattr(orig, "pgcode", None) == UNIQUE_VIOLATION:
+        # asyncpg's own error is the cause; psycopg2 carries diagnostics
+        constraint = getattr(orig.__cause__, "constraint_name", None) or \
+            getattr(getattr(orig, "diag", None), "constraint_name", None)
+        return constraint == FLAG_UNIQUE_CONSTRAINT
+    return str(orig) == SQLITE_DUPLICATE_FLAG
+
+
+async def _flag_access_error(db: AsyncSession, flag_id: int) -> HTTPException:
+    # Only reached when an access-checked statement matched nothing
+    if await get_feature_flag(db, flag_id=flag_id) is None:
+        return HTTPException(status_code=404, detail="Feature flag not found")
+    return HTTPException(status_code=403, detail="Not enough permissions")
+
 
 @router.get("/", response_model=List[FeatureFlag])
-def read_feature_flags(
+async def read_feature_flags(
+    request: Request,
+    response: Response,
     skip: int = 0,
     limit: int = 100,
+    cursor: Optional[str] = Query(None, description="Opaque cursor from a previous page's X-Next-Cursor"),
     project_id: Optional[int] = Query(None, description="Filter by project ID"),
     environment: Optional[Environment] = Query(None, description="Filter by environment"),
+    if_none_match: Optional[str] = Header(None),
     current_user: UserModel = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
+    after_id = decode_cursor(cursor)
     # If project_id is specified, check if user has access to that project
     if project_id:
-        db_project = get_project(db, project_id=project_id)
+        db_project = await get_project(db, project_id=project_id)
         if db_project is None:
             raise HTTPException(status_code=404, detail="Project not found")
         
         if current_user.role != "admin" and db_project.owner_id != current_user.id:
             raise HTTPException(status_code=403, detail="Not enough permissions")
+
+        listing = await get_project_flag_listing(db, project_id=project_id, environment=environment)
+        # The page bounds are part of the representation
+        etag = variant_etag(listing.etag, skip, limit, after_id)
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
+        set_etag(response, etag)
+        # The cached listing is ordered by id, so the cursor is a bisection
+        start = 0 if after_id is None else bisect_right(listing.flags, after_id, key=lambda flag: flag.id)
+        flags = listing.flags[start + skip:start + skip + limit]
+        set_next_cursor(request, response, flags, limit)
+        return models_response(flags, FeatureFlag, response)
     
-    flags = get_feature_flags(
+    flags = await get_feature_flag_rows(
         db, 
         skip=skip, 
         limit=limit, 
-        project_id=project_id,
-        environment=environment
+        environment=environment,
+        after_id=after_id
     )
-    return flags
+    set_next_cursor(request, response, flags, limit)
+    return rows_response(flags, FeatureFlag, response)
 
 
 @router.post("/", response_model=FeatureFlag)
-def create_new_feature_flag(
+async def create_new_feature_flag(
     flag: FeatureFlagCreate,
     current_user: UserModel = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     # Check if user has access to the project
-    db_project = get_project(db, project_id=flag.project_id)
+    db_project = await get_project(db, project_id=flag.project_id)
     if db_project is None:
         raise HTTPException(status_code=404, detail="Project not found")
     
     if current_user.role != "admin" and db_project.owner_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not enough permissions")
     
-    # Check if feature flag with same name already exists in the project
-    existing_flag = get_feature_flag_by_name_and_project(db, flag.name, flag.project_id)
-    if existing_flag:
-        raise HTTPException(
-            status_code=400, 
-            detail="Feature flag with this name already exists in this project"
-        )
-    
-    return create_feature_flag(db=db, flag=flag, created_by_id=current_user.id)
+    # The unique (project_id, name, environment) constraint settles concurrent creates
+    try:
+        return await create_feature_flag(db=db, flag=flag, created_by_id=current_user.id)
+    except IntegrityError as exc:
+        if not _is_duplicate_flag(exc):
+            raise
+        raise HTTPException(status_code=400, detail=DUPLICATE_FLAG_DETAIL)
+
+
+@router.post("/bulk", response_model=BulkFlagResponse)
+async def bulk_create_feature_flags(
+    batch: FeatureFlagBulkCreate,
+    current_user: UserModel = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    owners = await get_project_owners(db, (flag.project_id for flag in batch.flags))
+    results = [None] * len(batch.flags)
+    pending = {}
+    for index, flag in enumerate(batch.flags):
+        key = (flag.project_id, flag.name, flag.environment)
+        if flag.project_id not in owners:
+            results[index] = {"index": index, "status": "not_found"}
+        elif current_user.role != "admin" and owners[flag.project_id] != current_user.id:
+            results[index] = {"index": index, "status": "forbidden"}
+        elif key in pending:
+            results[index] = {"index": index, "status": "duplicate"}
+        else:
+            pending[key] = index
+
+    if pending:
+        try:
+            created = await create_feature_flags(
+                db, [batch.flags[index] for index in pending.values()], created_by_id=current_user.id
+            )
+        except IntegrityError as exc:
+            if not _is_duplicate_flag(exc):
+                raise
+            # Only on databases without ON CONFLICT; nothing was inserted
+            raise HTTPException(status_code=400, detail=DUPLICATE_FLAG_DETAIL)
+        created_by_key = {(flag.project_id, flag.name, flag.environment): flag for flag in created}
+        for key, index in pending.items():
+            db_flag = created_by_key.get(key)
+            if db_flag is None:
+                results[index] = {"index": index, "status": "conflict"}
+            else:
+                results[index] = {"index": index, "status": "created", "flag": db_flag}
+    return {"results": results}
+
+
+@router.patch("/bulk", response_model=BulkFlagResponse)
+async def bulk_update_feature_flags(
+    batch: FeatureFlagBulkUpdate,
+    current_user: UserModel = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    results = [None] * len(batch.updates)
+    updates = {}
+    positions = {}
+    for index, item in enumerate(batch.updates):
+        if item.id in updates:
+            results[index] = {"index": index, "status": "duplicate"}
+            continue
+        updates[item.id] = item.dict(exclude_unset=True, exclude={"id"})
+        positions[item.id] = index
+
+    try:
+        updated = await update_feature_flags(db, updates, owner_id=_owner_filter(current_user))
+    except IntegrityError as exc:
+        if not _is_duplicate_flag(exc):
+            raise
+        # The batch is one transaction, so a clash rolls all of it back
+        raise HTTPException(status_code=400, detail=DUPLICATE_FLAG_DETAIL)
+
+    updated_by_id = {flag.id: flag for flag in updated}
+    unmatched = [flag_id for flag_id in updates if flag_id not in updated_by_id]
+    existing = await get_existing_flag_ids(db, unmatched) if unmatched else set()
+    for flag_id, index in positions.items():
+        if flag_id in updated_by_id:
+            results[index] = {"index": index, "status": "updated", "flag": updated_by_id[flag_id]}
+        else:
+            results[index] = {"index": index, "status": "forbidden" if flag_id in existing else "not_found"}
+    return {"results": results}
+
+
+@router.post("/bulk/toggle", response_model=BulkFlagResponse)
+async def bulk_toggle_feature_flags(
+    batch: FeatureFlagBulkToggle,
+    current_user: UserModel = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    db_project = await get_project(db, project_id=batch.project_id)
+    if db_project is None:
+        raise HTTPException(status_code=404, detail="Project not found")
+
+    if current_user.role != "admin" and db_project.owner_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+
+    updated = await set_feature_flags_enabled(
+        db, project_id=batch.project_id, environments=batch.environments, names=batch.names,
+        is_enabled=batch.is_enabled
+    )
+    updated_by_key = {(flag.name, flag.environment): flag for flag in updated}
+    results = []
+    for index, name in enumerate(batch.names):
+        for environment in batch.environments:
+            db_flag = updated_by_key.get((name, environment))
+            results.append({
+                "index": index,
+                "status": "updated" if db_flag is not None else "not_found",
+                "environment": environment,
+                "flag": db_flag,
+            })
+    return {"results": results}
 
 
 @router.get("/{flag_id}", response_model=FeatureFlag)
-def read_feature_flag(
+async def read_feature_flag(
     flag_id: int,
     current_user: UserModel = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    db_flag = get_feature_flag(db, flag_id=flag_id)
-    if db_flag is None:
+    # Flag and project owner come back in one joined query
+    row = await get_feature_flag_with_owner(db, flag_id=flag_id)
+    if row is None:
         raise HTTPException(status_code=404, detail="Feature flag not found")
-    
-    # Check if user has access to the project
-    db_project = get_project(db, project_id=db_flag.project_id)
-    if current_user.role != "admin" and db_project.owner_id != current_user.id:
+
+    db_flag, owner_id = row
+    if current_user.role != "admin" and owner_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not enough permissions")
     
     return db_flag
 
 
 @router.put("/{flag_id}", response_model=FeatureFlag)
-def update_feature_flag_info(
+async def update_feature_flag_info(
     flag_id: int,
     flag_update: FeatureFlagUpdate,
     current_user: UserModel = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    db_flag = get_feature_flag(db, flag_id=flag_id)
-    if db_flag is None:
-        raise HTTPException(status_code=404, detail="Feature flag not found")
-    
-    # Check if user has access to the project
-    db_project = get_project(db, project_id=db_flag.project_id)
-    if current_user.role != "admin" and db_project.owner_id != current_user.id:
-        raise HTTPException(status_code=403, detail="Not enough permissions")
-    
-    updated_flag = update_feature_flag(db, flag_id=flag_id, flag_update=flag_update)
+    # The access check is part of the UPDATE itself
+    try:
+        updated_flag = await update_feature_flag(
+            db, flag_id=flag_id, flag_update=flag_update, owner_id=_owner_filter(current_user)
+        )
+    except IntegrityError as exc:
+        if not _is_duplicate_flag(exc):
+            raise
+        raise HTTPException(status_code=400, detail=DUPLICATE_FLAG_DETAIL)
+    if updated_flag is None:
+        raise await _flag_access_error(db, flag_id)
     return updated_flag
 
 
 @router.delete("/{flag_id}")
-def delete_feature_flag_by_id(
+async def delete_feature_flag_by_id(
     flag_id: int,
     current_user: UserModel = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    db_flag = get_feature_flag(db, flag_id=flag_id)
+    # The access check is part of the DELETE itself
+    db_flag = await delete_feature_flag(db, flag_id=flag_id, owner_id=_owner_filter(current_user))
     if db_flag is None:
-        raise HTTPException(status_code=404, detail="Feature flag not found")
-    
-    # Check if user has access to the project
-    db_project = get_project(db, project_id=db_flag.project_id)
-    if current_user.role != "admin" and db_project.owner_id != current_user.id:
-        raise HTTPException(status_code=403, detail="Not enough permissions")
-    
-    delete_feature_flag(db, flag_id=flag_id)
+        raise await _flag_access_error(db, flag_id)
     return {"message": "Feature flag deleted successfully"}
 
 
 @router.get("/project/{project_id}", response_model=List[FeatureFlag])
-def read_project_feature_flags(
+async def read_project_feature_flags(
     project_id: int,
+    response: Response,
     environment: Optional[Environment] = Query(None, description="Filter by environment"),
+    if_none_match: Optional[str] = Header(None),
     current_user: UserModel = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     # Check if user has access to the project
-    db_project = get_project(db, project_id=project_id)
+    db_project = await get_project(db, project_id=project_id)
     if db_project is None:
         raise HTTPException(status_code=404, detail="Project not found")
     
     if current_user.role != "admin" and db_project.owner_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not enough permissions")
     
-    flags = get_feature_flags(
+    listing = await get_project_flag_listing(
         db, 
         project_id=project_id,
         environment=environment
     )
-    return flags 
\ No newline at end of file
+    if etag_matches(if_none_match, listing.etag):
+        return not_modified(listing.etag)
+    set_etag(response, listing.etag)
+    return models_response(listing.flags, FeatureFlag, response)
+
+
+@router.get("/project/{project_id}/changes", response_model=FlagChanges)
+async def read_project_flag_changes(
+    project_id: int,
+    since: Optional[datetime] = Query(None, description="Watermark from the previous response"),
+    environment: Optional[Environment] = Query(None, description="Filter by environment"),
+    current_user: UserModel = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    db_project = await get_project(db, project_id=project_id)
+    if db_project is None:
+        raise HTTPException(status_code=404, detail="Project not found")
+
+    if current_user.role != "admin" and db_project.owner_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+
+    # Use the database clock: updated_at and deleted_at are stamped by it
+    now = await get_database_time(db)
+    if since is not None:
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        since = since.astimezone(timezone.utc)
+        if since < now - timedelta(days=settings.flag_deletion_retention_days):
+            raise HTTPException(
+                status_code=status.HTTP_410_GONE,
+                detail="Watermark is older than the deletion log; reload without `since`"
+            )
+
+    upserts, deletes = await get_flag_changes(db, project_id=project_id, since=since, environment=environment)
+    # Trail the clock so rows from transactions still in flight are picked up next time
+    watermark = now - timedelta(seconds=settings.flag_changes_settle_seconds)
+    if since is not None:
+        watermark = max(watermark, since)
+    return {"project_id": project_id, "watermark": watermark, "upserts": upserts, "deletes": deletes}
+
+
+@router.get("/project/{project_id}/stream")
+async def stream_project_feature_flags(
+    project_id: int,
+    environment: Optional[Environment] = Query(None, description="Filter by environment"),
+    current_user: UserModel = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    # Subscribe before loading the snapshot so no change can slip in between
+    subscription = broadcaster.subscribe(project_id, environment)
+    try:
+        snapshot = await load_snapshot(db, project_id, environment)
+    except BaseException:
+        broadcaster.unsubscribe(subscription)
+        raise
+    finally:
+        # Release the connection now; the session would otherwise live as long as the stream
+        await db.close()
+
+    if snapshot is None:
+        broadcaster.unsubscribe(subscription)
+        raise HTTPException(status_code=404, detail="Project not found")
+
+    if current_user.role != "admin" and snapshot.owner_id != current_user.id:
+        broadcaster.unsubscribe(subscription)
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+
+    return StreamingResponse(
+        stream_flag_changes(subscription, snapshot),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
\ No newline at end of file
@@ -1,46 +1,57 @@
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from ..database import get_db
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Header, Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..database import get_async_db
 from ..auth import get_current_active_user
-from ..crud import get_projects, get_project, create_project, update_project, delete_project
+from ..async_crud import (
+    get_project_rows, get_project, create_project, update_project, delete_project,
+    get_project_flag_listing
+)
+from ..conditional import etag_matches, not_modified, preferred_encoding, set_etag, variant_etag
+from ..pagination import decode_cursor, set_next_cursor
 from ..schemas import Project, ProjectCreate, ProjectUpdate
-from ..models import User as UserModel
+from ..serialization import rows_response
+from ..models import User as UserModel, Environment
 
 router = APIRouter(prefix="/projects", tags=["projects"])
 
 
 @router.get("/", response_model=List[Project])
-def read_projects(
+async def read_projects(
+    request: Request,
+    response: Response,
     skip: int = 0,
     limit: int = 100,
+    cursor: Optional[str] = None,
     current_user: UserModel = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
+    after_id = decode_cursor(cursor)
     # Users can only see their own projects unless they're admin
     if current_user.role == "admin":
-        projects = get_projects(db, skip=skip, limit=limit)
+        projects = await get_project_rows(db, skip=skip, limit=limit, after_id=after_id)
     else:
-        projects = get_projects(db, skip=skip, limit=limit, owner_id=current_user.id)
-    return projects
+        projects = await get_project_rows(db, skip=skip, limit=limit, owner_id=current_user.id, after_id=after_id)
+    set_next_cursor(request, response, projects, limit)
+    return rows_response(projects, Project, response)
 
 
 @router.post("/", response_model=Project)
-def create_new_project(
+async def create_new_project(
     project: ProjectCreate,
     current_user: UserModel = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    return create_project(db=db, project=project, owner_id=current_user.id)
+    return await create_project(db=db, project=project, owner_id=current_user.id)
 
 
 @router.get("/{project_id}", response_model=Project)
-def read_project(
+async def read_project(
     project_id: int,
     current_user: UserModel = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    db_project = get_project(db, project_id=project_id)
+    db_project = await get_project(db, project_id=project_id)
     if db_project is None:
         raise HTTPException(status_code=404, detail="Project not found")
     
@@ -52,13 +63,13 @@ def read_project(
 
 
 @router.put("/{project_id}", response_model=Project)
-def update_project_info(
+async def update_project_info(
     project_id: int,
     project_update: ProjectUpdate,
     current_user: UserModel = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    db_project = get_project(db, project_id=project_id)
+    db_project = await get_project(db, project_id=project_id)
     if db_project is None:
         raise HTTPException(status_code=404, detail="Project not found")
     
@@ -66,17 +77,17 @@ def update_project_info(
     if current_user.role != "admin" and db_project.owner_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not enough permissions")
     
-    updated_project = update_project(db, project_id=project_id, project_update=project_update)
+    updated_project = await update_project(db, project_id=project_id, project_update=project_update)
     return updated_project
 
 
 @router.delete("/{project_id}")
-def delete_project_by_id(
+async def delete_project_by_id(
     project_id: int,
     current_user: UserModel = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    db_project = get_project(db, project_id=project_id)
+    db_project = await get_project(db, project_id=project_id)
     if db_project is None:
         raise HTTPException(status_code=404, detail="Project not found")
     
@@ -84,5 +95,38 @@ def delete_project_by_id(
     if current_user.role != "admin" and db_project.owner_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not enough permissions")
     
-    delete_project(db, project_id=project_id)
-    return {"message": "Project deleted successfully"} 
\ No newline at end of file
+    await delete_project(db, project_id=project_id)
+    return {"message": "Project deleted successfully"} 
+
+
+@router.get("/{project_id}/snapshot", response_class=Response)
+async def read_project_snapshot(
+    project_id: int,
+    environment: Optional[Environment] = Query(None, description="Filter by environment"),
+    if_none_match: Optional[str] = Header(None),
+    accept_encoding: Optional[str] = Header(None),
+    current_user: UserModel = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    db_project = await get_project(db, project_id=project_id)
+    if db_project is None:
+        raise HTTPException(status_code=404, detail="Project not found")
+    
+    # Check if user has access to this project
+    if current_user.role != "admin" and db_project.owner_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+    
+    # The document is encoded once per flag change and sent here as raw bytes
+    listing = await get_project_flag_listing(db, project_id=project_id, environment=environment)
+    encoding = preferred_encoding(accept_encoding, listing.snapshot)
+    # Distinct from the JSON listing's ETag, and per content coding
+    etag = variant_etag(listing.etag, "snapshot", encoding)
+    vary = {"Vary": "Accept-Encoding"}
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag, vary)
+
+    response = Response(content=listing.snapshot[encoding], media_type="application/json", headers=vary)
+    if encoding != "identity":
+        response.headers["Content-Encoding"] = encoding
+    set_etag(response, etag)
+    return response
@@ -1,58 +1,64 @@
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from ..database import get_db
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, status, Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..database import get_async_db
 from ..auth import get_current_active_user, require_admin
-from ..crud import get_users, get_user, update_user, delete_user
+from ..async_crud import get_user_rows, get_user, update_user, delete_user
+from ..pagination import decode_cursor, set_next_cursor
 from ..schemas import User, UserUpdate
+from ..serialization import rows_response
 from ..models import User as UserModel
 
 router = APIRouter(prefix="/users", tags=["users"])
 
 
 @router.get("/", response_model=List[User])
-def read_users(
+async def read_users(
+    request: Request,
+    response: Response,
     skip: int = 0,
     limit: int = 100,
+    cursor: Optional[str] = None,
     current_user: UserModel = Depends(require_admin),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    users = get_users(db, skip=skip, limit=limit)
-    return users
+    users = await get_user_rows(db, skip=skip, limit=limit, after_id=decode_cursor(cursor))
+    set_next_cursor(request, response, users, limit)
+    return rows_response(users, User, response)
 
 
 @router.get("/{user_id}", response_model=User)
-def read_user(
+async def read_user(
     user_id: int,
     current_user: UserModel = Depends(require_admin),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    db_user = get_user(db, user_id=user_id)
+    db_user = await get_user(db, user_id=user_id)
     if db_user is None:
         raise HTTPException(status_code=404, detail="User not found")
     return db_user
 
 
 @router.put("/{user_id}", response_model=User)
-def update_user_info(
+async def update_user_info(
     user_id: int,
     user_update: UserUpdate,
     current_user: UserModel = Depends(require_admin),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    db_user = update_user(db, user_id=user_id, user_update=user_update)
+    db_user = await update_user(db, user_id=user_id, user_update=user_update)
     if db_user is None:
         raise HTTPException(status_code=404, detail="User not found")
     return db_user
 
 
 @router.delete("/{user_id}")
-def delete_user_by_id(
+async def delete_user_by_id(
     user_id: int,
     current_user: UserModel = Depends(require_admin),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    db_user = delete_user(db, user_id=user_id)
+    db_user = await delete_user(db, user_id=user_id)
     if db_user is None:
         raise HTTPException(status_code=404, detail="User not found")
     return {"message": "User deleted successfully"} 
\ No newline at end of file
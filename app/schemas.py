@@ -1,5 +1,6 @@
-from pydantic import BaseModel, EmailStr
-from typing import Optional, List
+import json
+from pydantic import BaseModel, EmailStr, Field, field_validator, model_validator
+from typing import Annotated, Optional, List, Dict, Literal, Tuple, Union
 from datetime import datetime
 from .models import UserRole, Environment
 
@@ -58,13 +59,76 @@ class Project(ProjectBase):
         from_attributes = True
 
 
+# Targeting schemas
+AttributeValue = Union[bool, int, float, str]
+
+
+class GroupRule(BaseModel):
+    type: Literal["group"] = "group"
+    groups: List[str] = Field(min_length=1)
+
+
+class AttributeRule(BaseModel):
+    type: Literal["attribute"] = "attribute"
+    attribute: str
+    # Equality is an in-list check with a single value
+    values: List[AttributeValue] = Field(min_length=1)
+
+
+class RangeRule(BaseModel):
+    type: Literal["range"] = "range"
+    attribute: str
+    # [min, max) intervals; either bound may be null for an open end
+    ranges: List[Tuple[Optional[float], Optional[float]]] = Field(min_length=1)
+
+    @field_validator("ranges")
+    @classmethod
+    def check_bounds(cls, ranges):
+        for low, high in ranges:
+            if low is not None and high is not None and low >= high:
+                raise ValueError("range minimum must be below its maximum")
+        return ranges
+
+
+class RolloutRule(BaseModel):
+    type: Literal["rollout"] = "rollout"
+    # Share of users, bucketed by a stable hash of (flag name, user_id)
+    percentage: float = Field(ge=0, le=100)
+
+
+TargetingRule = Annotated[Union[GroupRule, AttributeRule, RangeRule, RolloutRule], Field(discriminator="type")]
+
+
+class Targeting(BaseModel):
+    """A user is targeted when every rule matches."""
+
+    rules: List[TargetingRule] = []
+
+    @model_validator(mode="before")
+    @classmethod
+    def upgrade_legacy(cls, data):
+        # Older clients send a JSON string, and {"groups": [...]} as the whole rule set
+        if isinstance(data, str):
+            try:
+                data = json.loads(data)
+            except ValueError:
+                data = {"groups": [data]}
+        if isinstance(data, dict) and "rules" not in data:
+            # Anything else would silently compile to a flag that targets everyone
+            if "groups" not in data:
+                raise ValueError('targeting must have "rules" or "groups"')
+            groups = data["groups"]
+            data = {"rules": [{"type": "group", "groups": [groups] if isinstance(groups, str) else groups}]}
+        return data
+
+
 # Feature Flag schemas
 class FeatureFlagBase(BaseModel):
     name: str
     description: Optional[str] = None
     is_enabled: bool = False
     environment: Environment
-    user_group_targeting: Optional[str] = None
+    user_group_targeting: Optional[Targeting] = None
 
 
 class FeatureFlagCreate(FeatureFlagBase):
@@ -76,7 +140,7 @@ class FeatureFlagUpdate(BaseModel):
     description: Optional[str] = None
     is_enabled: Optional[bool] = None
     environment: Optional[Environment] = None
-    user_group_targeting: Optional[str] = None
+    user_group_targeting: Optional[Targeting] = None
 
 
 class FeatureFlag(FeatureFlagBase):
@@ -90,6 +154,77 @@ class FeatureFlag(FeatureFlagBase):
         from_attributes = True
 
 
+# Bulk schemas; each batch runs in a single transaction
+class FeatureFlagBulkCreate(BaseModel):
+    flags: List[FeatureFlagCreate] = Field(min_length=1, max_length=1000)
+
+
+class FeatureFlagBulkUpdateItem(FeatureFlagUpdate):
+    id: int
+
+
+class FeatureFlagBulkUpdate(BaseModel):
+    updates: List[FeatureFlagBulkUpdateItem] = Field(min_length=1, max_length=1000)
+
+
+class FeatureFlagBulkToggle(BaseModel):
+    project_id: int
+    environments: List[Environment] = Field(min_length=1)
+    names: List[str] = Field(min_length=1, max_length=1000)
+    is_enabled: bool
+
+
+class BulkFlagResult(BaseModel):
+    # Position in the request (for toggles, of the name)
+    index: int
+    # "created", "updated", "not_found", "forbidden", "conflict" or "duplicate"
+    status: str
+    environment: Optional[Environment] = None
+    flag: Optional[FeatureFlag] = None
+
+
+class BulkFlagResponse(BaseModel):
+    results: List[BulkFlagResult]
+
+
+class FlagTombstone(BaseModel):
+    flag_id: int
+    name: str
+    environment: Environment
+    deleted_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
+class FlagChanges(BaseModel):
+    project_id: int
+    # Pass back as `since` on the next call
+    watermark: datetime
+    upserts: List[FeatureFlag]
+    deletes: List[FlagTombstone]
+
+
+# Evaluation schemas
+class EvaluationContext(BaseModel):
+    user_id: Optional[str] = None
+    groups: List[str] = []
+    attributes: Dict[str, AttributeValue] = {}
+
+
+class EvaluationRequest(BaseModel):
+    project_id: int
+    environment: Environment
+    user: EvaluationContext = EvaluationContext()
+    flags: Optional[List[str]] = None
+
+
+class EvaluationResult(BaseModel):
+    project_id: int
+    environment: Environment
+    flags: Dict[str, bool]
+
+
 # Authentication schemas
 class Token(BaseModel):
     access_token: str
@@ -0,0 +1,53 @@
+"""Exports every flag to a binary snapshot for clients to read during outages.
+
+Run with ``python -m app.snapshot_export PATH``, e.g. from cron, and ship the
+file to hosts that pass it to ``FeatureFlagClient(snapshot_path=...)`` or read
+it with ``featureflag_client.SnapshotFile``.
+"""
+import sys
+from typing import Dict, Iterator
+from sqlalchemy.orm import Session
+from featureflag_client.snapshot import write_snapshot
+from . import crud
+
+EXPORT_BATCH_SIZE = 5000
+
+
+def iter_flags(db: Session) -> Iterator[Dict[str, object]]:
+    after_id = None
+    while True:
+        batch = crud.get_feature_flags(db, limit=EXPORT_BATCH_SIZE, after_id=after_id)
+        for flag in batch:
+            yield {
+                "id": flag.id,
+                "project_id": flag.project_id,
+                "environment": flag.environment.value,
+                "name": flag.name,
+                "is_enabled": flag.is_enabled,
+                "user_group_targeting": flag.user_group_targeting,
+            }
+        if len(batch) < EXPORT_BATCH_SIZE:
+            return
+        after_id = batch[-1].id
+        # Only the encoded entries are kept; drop the ORM rows between pages
+        db.expunge_all()
+
+
+def export_snapshot(db: Session, path: str) -> int:
+    return write_snapshot(path, iter_flags(db))
+
+
+def main() -> int:
+    from .database import SessionLocal
+
+    if len(sys.argv) != 2:
+        print("usage: python -m app.snapshot_export PATH", file=sys.stderr)
+        return 2
+    with SessionLocal() as db:
+        count = export_snapshot(db, sys.argv[1])
+    print(f"wrote {count} flags to {sys.argv[1]}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
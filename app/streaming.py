@@ -0,0 +1,157 @@
+import asyncio
+import json
+from collections import defaultdict
+from typing import AsyncIterator, Dict, NamedTuple, Optional, Set, Tuple
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy.ext.asyncio import AsyncSession
+from . import async_crud, schemas
+from .cache import flag_cache
+from .config import settings
+from .database import AsyncSessionLocal
+from .models import Environment
+from .notifications import FlagChange, add_change_handler
+
+# Queued in place of a change when the subscriber fell behind and must reload
+RESYNC = None
+
+
+class FlagSnapshot(NamedTuple):
+    owner_id: int
+    version: int
+    flags: Tuple[schemas.FeatureFlag, ...]
+
+
+async def load_snapshot(db: AsyncSession, project_id: int,
+                        environment: Optional[Environment]) -> Optional[FlagSnapshot]:
+    db_project = await async_crud.get_project(db, project_id=project_id)
+    if db_project is None:
+        return None
+    version = flag_cache.version((project_id, environment))
+    flags = await async_crud.get_project_feature_flags(db, project_id=project_id, environment=environment)
+    return FlagSnapshot(db_project.owner_id, version, flags)
+
+
+async def _reload_snapshot(project_id: int, environment: Optional[Environment]) -> Optional[FlagSnapshot]:
+    async with AsyncSessionLocal() as db:
+        return await load_snapshot(db, project_id, environment)
+
+
+class Subscription:
+    __slots__ = ("project_id", "environment", "queue")
+
+    def __init__(self, project_id: int, environment: Optional[Environment], max_queue: int):
+        self.project_id = project_id
+        self.environment = environment
+        self.queue: "asyncio.Queue[Optional[FlagChange]]" = asyncio.Queue(max_queue)
+
+    def offer(self, change: FlagChange):
+        if self.environment is not None and change.environment not in (None, self.environment):
+            return
+        try:
+            self.queue.put_nowait(change)
+        except asyncio.QueueFull:
+            # A slow client gets one full snapshot instead of an unbounded backlog
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(RESYNC)
+
+
+class ChangeBroadcaster:
+    """Fans flag changes out to the SSE subscribers of this worker.
+
+    Changes can arrive from request handlers or the LISTEN thread, so they are
+    handed to the event loop with ``call_soon_threadsafe``. Idle subscribers
+    cost one small queue each and no database connection.
+    """
+
+    def __init__(self, max_queue: int = 64):
+        self.max_queue = max_queue
+        self._subscriptions: Dict[int, Set[Subscription]] = defaultdict(set)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def subscribe(self, project_id: int, environment: Optional[Environment]) -> Subscription:
+        self._loop = asyncio.get_running_loop()
+        subscription = Subscription(project_id, environment, self.max_queue)
+        self._subscriptions[project_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        subscriptions = self._subscriptions.get(subscription.project_id)
+        if subscriptions is None:
+            return
+        subscriptions.discard(subscription)
+        if not subscriptions:
+            del self._subscriptions[subscription.project_id]
+
+    def publish(self, change: FlagChange):
+        loop = self._loop
+        if loop is None or loop.is_closed() or change.project_id not in self._subscriptions:
+            return
+        loop.call_soon_threadsafe(self._fan_out, change)
+
+    def _fan_out(self, change: FlagChange):
+        for subscription in list(self._subscriptions.get(change.project_id, ())):
+            subscription.offer(change)
+
+    @property
+    def subscriber_count(self) -> int:
+        return sum(len(subscriptions) for subscriptions in self._subscriptions.values())
+
+
+broadcaster = ChangeBroadcaster()
+add_change_handler(broadcaster.publish)
+
+
+def format_event(event: str, data, event_id: Optional[int] = None) -> str:
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(jsonable_encoder(data), separators=(',', ':'))}")
+    return "\n".join(lines) + "\n\n"
+
+
+def _snapshot_event(snapshot: FlagSnapshot) -> str:
+    return format_event("snapshot", {"version": snapshot.version, "flags": snapshot.flags}, snapshot.version)
+
+
+def _change_event(subscription: Subscription, change: FlagChange) -> Optional[str]:
+    event = change.event
+    environment = subscription.environment
+    if environment is not None and change.flag["environment"] != environment.value:
+        previous = change.previous_environment
+        # Unknown for changes from workers that predate it; a spare delete is harmless
+        if previous is not None and previous != environment:
+            # Neither in nor leaving the subscribed environment
+            return None
+        # The flag moved out of the subscribed environment
+        event = "deleted"
+    return format_event(event, {"version": change.version, "flag": change.flag}, change.version)
+
+
+async def stream_flag_changes(subscription: Subscription, snapshot: FlagSnapshot) -> AsyncIterator[str]:
+    try:
+        yield _snapshot_event(snapshot)
+        while True:
+            try:
+                change = await asyncio.wait_for(
+                    subscription.queue.get(), timeout=settings.stream_heartbeat_seconds
+                )
+            except asyncio.TimeoutError:
+                # SSE comment line; keeps proxies from closing an idle connection
+                yield ": keep-alive\n\n"
+                continue
+
+            if change is not RESYNC and change.event is not None and change.flag is not None:
+                event = _change_event(subscription, change)
+                if event is not None:
+                    yield event
+                continue
+
+            snapshot = await _reload_snapshot(subscription.project_id, subscription.environment)
+            if snapshot is None:
+                yield format_event("project_deleted", {"project_id": subscription.project_id})
+                return
+            yield _snapshot_event(snapshot)
+    finally:
+        broadcaster.unsubscribe(subscription)
@@ -0,0 +1,63 @@
+from bisect import bisect_left
+from typing import Dict, Sequence
+
+# Upper bounds in seconds, from sub-millisecond cache hits to multi-second stalls
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Fixed-bucket histogram with cumulative export in the Prometheus style.
+
+    ``observe`` only bumps two list slots and two floats, relying on the GIL
+    instead of a lock; a concurrent update can at worst be lost, never corrupt
+    the structure.
+    """
+
+    __slots__ = ("buckets", "counts", "count", "sum")
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        # One extra slot for observations above the last bound (+Inf)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def snapshot(self) -> Dict[str, object]:
+        cumulative = {}
+        running = 0
+        for bound, count in zip(self.buckets, self.counts):
+            running += count
+            cumulative[str(bound)] = running
+        cumulative["+Inf"] = running + self.counts[-1]
+        return {"count": self.count, "sum": self.sum, "buckets": cumulative}
+
+
+class PoolStats:
+    """Connection acquisition telemetry for one engine's pool."""
+
+    def __init__(self):
+        self.wait_seconds = Histogram()
+        self.timeouts = 0
+        self.checkouts = 0
+
+    def report(self, pool) -> Dict[str, object]:
+        stats = {
+            "pool_class": type(pool).__name__,
+            "checkouts": self.checkouts,
+            "timeouts": self.timeouts,
+            "wait_seconds": self.wait_seconds.snapshot(),
+        }
+        # Only queue pools have a fixed size and overflow
+        if hasattr(pool, "checkedout"):
+            stats.update({
+                "size": pool.size(),
+                "checked_in": pool.checkedin(),
+                "checked_out": pool.checkedout(),
+                "overflow": pool.overflow(),
+            })
+        return stats
@@ -0,0 +1,90 @@
+"""Background cache warm-up after startup, reported by ``/ready``.
+
+The worker serves ``/health`` as soon as it starts. In the background it loads
+the flag listings of the most recently changed projects into ``flag_cache``
+and compiles their rulesets, retrying until the database is reachable;
+``/ready`` reports ready once that is done, so a load balancer only routes
+traffic to warm workers.
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Dict, Optional
+from . import async_crud, models
+from .config import settings
+from .database import AsyncSessionLocal, async_engine
+from .evaluation import rulesets
+from .notifications import change_listener
+from .revocations import revocations
+
+logger = logging.getLogger(__name__)
+
+WARM_BATCH_SIZE = 100
+
+
+class Readiness:
+    def __init__(self):
+        self.warmed = False
+        self.projects = 0
+        self.seconds: Optional[float] = None
+        self.error: Optional[str] = None
+
+    @property
+    def ready(self) -> bool:
+        # Stateless tokens can't be checked against revocations until they have loaded once
+        return self.warmed and (not settings.stateless_auth or revocations.loaded)
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            "status": "ready" if self.ready else "warming",
+            "projects_warmed": self.projects,
+            "warm_up_seconds": self.seconds,
+            "error": self.error,
+        }
+
+
+readiness = Readiness()
+
+
+async def _warm_projects(limit: int):
+    readiness.projects = 0
+    async with AsyncSessionLocal() as db:
+        projects = await async_crud.get_recently_changed_projects(db, limit)
+    for start in range(0, len(projects), WARM_BATCH_SIZE):
+        batch = projects[start:start + WARM_BATCH_SIZE]
+        async with AsyncSessionLocal() as db:
+            listings = await async_crud.warm_flag_listings(db, [project.id for project in batch])
+        for project in batch:
+            for environment in models.Environment:
+                listing = listings.get((project.id, environment))
+                if listing is not None:
+                    rulesets.prime(project, environment, listing.flags)
+        readiness.projects += len(batch)
+        # Let requests in between batches
+        await asyncio.sleep(0)
+
+
+async def warm_up(retry_interval: float = 1.0, max_retry_interval: float = 30.0):
+    started = time.perf_counter()
+    delay = retry_interval
+    while True:
+        try:
+            if settings.create_schema_on_startup:
+                async with async_engine.begin() as connection:
+                    await connection.run_sync(models.Base.metadata.create_all)
+            # The listener drops the whole cache when it connects, so warm after that
+            while change_listener.running and not change_listener.listening.is_set():
+                await asyncio.sleep(0.05)
+            if settings.cache_prewarm_projects > 0:
+                await _warm_projects(settings.cache_prewarm_projects)
+            break
+        except Exception as exc:
+            readiness.error = str(exc)
+            logger.warning("Cache warm-up failed, retrying in %.0fs: %s", delay, exc)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, max_retry_interval)
+
+    readiness.error = None
+    readiness.seconds = time.perf_counter() - started
+    readiness.warmed = True
+    logger.info("Warmed %d projects in %.2fs", readiness.projects, readiness.seconds)
@@ -0,0 +1 @@
+"""In-process benchmarks for the API hot paths; see ``python -m benchmarks.run --help``."""
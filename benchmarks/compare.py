@@ -0,0 +1,60 @@
+"""Compares two benchmark result files.
+
+``python -m benchmarks.compare BASELINE CURRENT`` exits non-zero when any
+scenario's p50 or p99 latency grew, or its throughput fell, by more than the
+threshold.
+"""
+import argparse
+import json
+import sys
+from typing import Dict, List
+
+DEFAULT_THRESHOLD = 0.25
+
+
+def compare(baseline: Dict, current: Dict, threshold: float = DEFAULT_THRESHOLD) -> List[str]:
+    regressions = []
+    for name, result in current["results"].items():
+        base = baseline["results"].get(name)
+        if base is None:
+            continue
+        for metric in ("p50_ms", "p99_ms"):
+            if base[metric] > 0 and result[metric] > base[metric] * (1 + threshold):
+                regressions.append(
+                    f"{name}: {metric} {base[metric]:.3f} -> {result[metric]:.3f} "
+                    f"(+{result[metric] / base[metric] - 1:.0%})"
+                )
+        if result["ops_per_s"] < base["ops_per_s"] / (1 + threshold):
+            regressions.append(
+                f"{name}: ops_per_s {base['ops_per_s']:.1f} -> {result['ops_per_s']:.1f} "
+                f"({result['ops_per_s'] / base['ops_per_s'] - 1:.0%})"
+            )
+    return regressions
+
+
+def report(baseline: Dict, current: Dict, threshold: float) -> int:
+    if baseline.get("meta", {}).get("scale") != current.get("meta", {}).get("scale"):
+        print("warning: the runs used different scales", file=sys.stderr)
+    regressions = compare(baseline, current, threshold)
+    for line in regressions:
+        print(f"REGRESSION {line}")
+    if not regressions:
+        print(f"no regressions beyond {threshold:.0%}")
+    return 1 if regressions else 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    args = parser.parse_args()
+    with open(args.baseline) as file:
+        baseline = json.load(file)
+    with open(args.current) as file:
+        current = json.load(file)
+    return report(baseline, current, args.threshold)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
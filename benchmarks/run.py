@@ -0,0 +1,303 @@
+"""Benchmarks the API hot paths in-process.
+
+The FastAPI app is driven through ``TestClient`` against a seeded local
+database (a throwaway SQLite file unless ``--database-url`` is given), so runs
+need no server and are repeatable. Each scenario reports p50/p99 latency and
+throughput; ``--output`` saves them as a JSON baseline and ``--baseline``
+compares against one, exiting non-zero on regressions.
+
+    python -m benchmarks.run --projects 10000 --flags 1000000 --users 100000 --output baseline.json
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, NamedTuple
+
+from .compare import DEFAULT_THRESHOLD, report
+
+
+class Scenario(NamedTuple):
+    name: str
+    # Returns the operation to time, which takes the iteration number
+    setup: Callable[["Context"], Callable[[int], None]]
+    # Caps the iterations for scenarios dominated by deliberate cost (bcrypt)
+    max_iterations: int = 0
+
+
+class Context:
+    def __init__(self, client, args, rng: random.Random):
+        self.client = client
+        self.args = args
+        self.rng = rng
+        self.admin = {}
+        self.developer = {}
+        self.developer_project_id = 0
+        self.created_flag_ids: List[int] = []
+
+    def random_project(self) -> int:
+        return self.rng.randint(1, self.args.projects)
+
+    def random_flag(self) -> int:
+        return self.rng.randint(1, self.args.flags)
+
+    def request(self, method: str, url: str, expected: int = 200, **kwargs):
+        response = self.client.request(method, url, **kwargs)
+        if response.status_code != expected:
+            raise RuntimeError(f"{method} {url} returned {response.status_code}: {response.text[:200]}")
+        return response
+
+
+API = "/api/v1"
+
+
+def _login(context: Context, username: str, password: str) -> Dict[str, str]:
+    response = context.request("POST", f"{API}/auth/token", data={"username": username, "password": password})
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+def auth_token(context: Context):
+    from .seed import ADMIN_USERNAME, PASSWORD
+    return lambda i: _login(context, ADMIN_USERNAME, PASSWORD)
+
+
+def auth_me(context: Context):
+    return lambda i: context.request("GET", f"{API}/auth/me", headers=context.developer)
+
+
+def projects_list(context: Context):
+    return lambda i: context.request("GET", f"{API}/projects/?limit=100", headers=context.developer)
+
+
+def users_list(context: Context):
+    return lambda i: context.request("GET", f"{API}/users/?limit=100", headers=context.admin)
+
+
+def flags_list(context: Context):
+    from app.pagination import encode_cursor
+    # Not filtered by project, so served from the database rather than the flag cache
+    return lambda i: context.request(
+        "GET", f"{API}/feature-flags/?limit=100&cursor={encode_cursor(context.random_flag() - 1)}",
+        headers=context.admin
+    )
+
+
+def flags_list_page(context: Context):
+    return lambda i: context.request(
+        "GET", f"{API}/feature-flags/?project_id={context.random_project()}&limit=100", headers=context.admin
+    )
+
+
+def flags_project_listing(context: Context):
+    return lambda i: context.request(
+        "GET", f"{API}/feature-flags/project/{context.random_project()}?environment=prod", headers=context.admin
+    )
+
+
+def flags_read(context: Context):
+    return lambda i: context.request("GET", f"{API}/feature-flags/{context.random_flag()}", headers=context.admin)
+
+
+def flags_read_owned(context: Context):
+    return lambda i: context.request(
+        "GET", f"{API}/feature-flags/project/{context.developer_project_id}", headers=context.developer
+    )
+
+
+def flags_update(context: Context):
+    return lambda i: context.request(
+        "PUT", f"{API}/feature-flags/{context.random_flag()}", json={"is_enabled": i % 2 == 0}, headers=context.admin
+    )
+
+
+def flags_create(context: Context):
+    def create(i: int):
+        response = context.request("POST", f"{API}/feature-flags/", headers=context.admin, json={
+            "name": f"bench_created_{time.time_ns()}_{i}",
+            "is_enabled": True,
+            "environment": "dev",
+            "project_id": context.random_project(),
+        })
+        context.created_flag_ids.append(response.json()["id"])
+    return create
+
+
+def flags_delete(context: Context):
+    def delete(i: int):
+        if context.created_flag_ids:
+            context.request("DELETE", f"{API}/feature-flags/{context.created_flag_ids.pop()}", headers=context.admin)
+    return delete
+
+
+def _evaluation_user(context: Context, user_id: int) -> Dict:
+    from .seed import GROUPS
+    return {"user_id": str(user_id), "groups": context.rng.sample(GROUPS, 2), "attributes": {"plan": "pro"}}
+
+
+def evaluate(context: Context):
+    return lambda i: context.request("POST", f"{API}/evaluate", headers=context.admin, json={
+        "project_id": context.random_project(),
+        "environment": "prod",
+        "user": _evaluation_user(context, i),
+    })
+
+
+def evaluate_bulk(context: Context):
+    users = [_evaluation_user(context, user_id) for user_id in range(1000)]
+    return lambda i: context.request(
+        "POST", f"{API}/evaluate/bulk?project_id={context.random_project()}&environment=prod",
+        headers=context.admin, json={"users": users},
+    )
+
+
+SCENARIOS = (
+    Scenario("auth.token", auth_token, max_iterations=20),
+    Scenario("auth.me", auth_me),
+    Scenario("users.list", users_list),
+    Scenario("projects.list", projects_list),
+    Scenario("flags.list", flags_list),
+    Scenario("flags.list_page", flags_list_page),
+    Scenario("flags.project_listing", flags_project_listing),
+    Scenario("flags.project_listing_owned", flags_read_owned),
+    Scenario("flags.read", flags_read),
+    Scenario("flags.update", flags_update),
+    Scenario("flags.create", flags_create),
+    Scenario("flags.delete", flags_delete),
+    Scenario("evaluate", evaluate),
+    Scenario("evaluate.bulk_1000", evaluate_bulk, max_iterations=50),
+)
+
+
+def percentile(ordered: List[float], fraction: float) -> float:
+    # Nearest-rank, so p99 of 100 samples is the 99th slowest
+    return ordered[max(0, min(len(ordered) - 1, math.ceil(fraction * len(ordered)) - 1))]
+
+
+def measure(operation: Callable[[int], None], iterations: int, warmup: int) -> Dict[str, float]:
+    for i in range(warmup):
+        operation(i)
+    latencies = []
+    started = time.perf_counter()
+    for i in range(iterations):
+        before = time.perf_counter()
+        operation(i)
+        latencies.append(time.perf_counter() - before)
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "n": iterations,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "max_ms": latencies[-1] * 1000,
+        "ops_per_s": iterations / elapsed,
+    }
+
+
+def _git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--projects", type=int, default=100)
+    parser.add_argument("--flags", type=int, default=10000)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--database-url", help="Defaults to a fresh SQLite file in a temporary directory")
+    parser.add_argument("--reuse", action="store_true", help="Skip seeding if the database is already seeded")
+    parser.add_argument("--only", action="append", default=[], help="Run scenarios starting with this prefix")
+    parser.add_argument("--output", help="Write the results as JSON")
+    parser.add_argument("--baseline", help="Compare against a previous --output file")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    return parser.parse_args()
+
+
+def main() -> int:
+    args = parse_args()
+    if args.projects < 1 or args.flags < 1 or args.users < 2:
+        raise SystemExit("need at least one project, one flag and two users (an admin and a developer)")
+    database_url = args.database_url or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.sqlite')}"
+    # Settings are read on import, so the app must be imported after this
+    os.environ["DATABASE_URL"] = database_url
+    os.environ.pop("ASYNC_DATABASE_URL", None)
+
+    from fastapi.testclient import TestClient
+    from sqlalchemy import select
+    from app import models
+    from app.database import SessionLocal, engine
+    from app.main import app
+    from . import seed
+
+    if not (args.reuse and seed.is_seeded(engine)):
+        started = time.perf_counter()
+        seed.seed(engine, args.projects, args.flags, args.users, seed=args.seed)
+        print(f"seeded {args.projects} projects, {args.flags} flags, {args.users} users "
+              f"in {time.perf_counter() - started:.1f}s")
+
+    with SessionLocal() as db:
+        # A developer who owns project 1, for the access-checked paths
+        developer_id = db.scalar(select(models.Project.owner_id).where(models.Project.id == 1))
+        developer = db.scalar(select(models.User.username).where(models.User.id == developer_id))
+
+    results = {}
+    with TestClient(app) as client:
+        # Measure warm workers, as a load balancer would only route to those
+        deadline = time.monotonic() + 120
+        while client.get("/ready").status_code != 200:
+            if time.monotonic() > deadline:
+                raise SystemExit("the app did not become ready")
+            time.sleep(0.05)
+        context = Context(client, args, random.Random(args.seed))
+        context.admin = _login(context, seed.ADMIN_USERNAME, seed.PASSWORD)
+        context.developer = _login(context, developer, seed.PASSWORD)
+        context.developer_project_id = 1
+        print(f"{'scenario':<30}{'p50 ms':>10}{'p99 ms':>10}{'ops/s':>10}")
+        for scenario in SCENARIOS:
+            if args.only and not any(scenario.name.startswith(prefix) for prefix in args.only):
+                continue
+            iterations = args.iterations
+            warmup = args.warmup
+            if scenario.max_iterations:
+                iterations = min(iterations, scenario.max_iterations)
+                warmup = min(warmup, 2)
+            result = measure(scenario.setup(context), iterations, warmup)
+            results[scenario.name] = result
+            print(f"{scenario.name:<30}{result['p50_ms']:>10.2f}{result['p99_ms']:>10.2f}{result['ops_per_s']:>10.1f}")
+
+    current = {
+        "meta": {
+            "revision": _git_revision(),
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "database": engine.dialect.name,
+            "scale": {"projects": args.projects, "flags": args.flags, "users": args.users},
+            "iterations": args.iterations,
+            "seed": args.seed,
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(current, file, indent=2)
+    if args.baseline:
+        with open(args.baseline) as file:
+            return report(json.load(file), current, args.threshold)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,96 @@
+"""Synthetic catalogs for the benchmarks.
+
+Rows are inserted with Core ``executemany`` batches rather than through the API,
+so a million flags take seconds, and every user shares one bcrypt hash.
+"""
+import random
+from typing import Dict, List
+from sqlalchemy import func, insert, select, text
+from sqlalchemy.engine import Engine
+from app import models
+from app.auth import get_password_hash
+
+ADMIN_USERNAME = "bench_admin"
+PASSWORD = "bench-password"
+GROUPS = ("beta", "internal", "staff", "early_access", "enterprise")
+INSERT_BATCH_SIZE = 10000
+
+
+def _targeting(rng: random.Random):
+    # Roughly the mix seen in practice: mostly untargeted, some groups, a few rollouts
+    roll = rng.random()
+    if roll < 0.6:
+        return None
+    if roll < 0.85:
+        return {"rules": [{"type": "group", "groups": rng.sample(GROUPS, 2)}]}
+    if roll < 0.95:
+        return {"rules": [{"type": "rollout", "percentage": rng.choice((1, 5, 10, 25, 50))}]}
+    return {"rules": [{"type": "attribute", "attribute": "plan", "values": ["pro", "enterprise"]}]}
+
+
+def _insert(engine: Engine, table, rows: List[Dict]):
+    with engine.begin() as connection:
+        for start in range(0, len(rows), INSERT_BATCH_SIZE):
+            connection.execute(insert(table), rows[start:start + INSERT_BATCH_SIZE])
+
+
+def is_seeded(engine: Engine) -> bool:
+    with engine.connect() as connection:
+        return connection.execute(
+            select(func.count()).select_from(models.User).where(models.User.username == ADMIN_USERNAME)
+        ).scalar_one() > 0
+
+
+def seed(engine: Engine, projects: int, flags: int, users: int, seed: int = 0) -> Dict[str, int]:
+    """Create ``users`` users (the first an admin), ``projects`` projects and ``flags`` flags."""
+    rng = random.Random(seed)
+    models.Base.metadata.create_all(bind=engine)
+    hashed_password = get_password_hash(PASSWORD)
+
+    user_rows = [{
+        "id": user_id,
+        "email": f"user{user_id}@bench.example.com",
+        "username": ADMIN_USERNAME if user_id == 1 else f"bench_user{user_id}",
+        "hashed_password": hashed_password,
+        "role": models.UserRole.ADMIN if user_id == 1 else models.UserRole.DEVELOPER,
+        "is_active": True,
+        "token_version": 0,
+    } for user_id in range(1, users + 1)]
+    _insert(engine, models.User.__table__, user_rows)
+
+    project_rows = [{
+        "id": project_id,
+        "name": f"project_{project_id}",
+        "description": "Synthetic benchmark project",
+        # Projects belong to developers; the admin sees all of them anyway
+        "owner_id": rng.randint(2, users),
+    } for project_id in range(1, projects + 1)]
+    _insert(engine, models.Project.__table__, project_rows)
+
+    environments = list(models.Environment)
+    flag_rows = []
+    for flag_id in range(1, flags + 1):
+        project_id = (flag_id - 1) % projects + 1
+        flag_rows.append({
+            "id": flag_id,
+            "name": f"flag_{flag_id}",
+            "description": None,
+            "is_enabled": rng.random() < 0.5,
+            "environment": environments[flag_id % len(environments)],
+            "project_id": project_id,
+            "created_by_id": project_rows[project_id - 1]["owner_id"],
+            "user_group_targeting": _targeting(rng),
+        })
+        if len(flag_rows) == INSERT_BATCH_SIZE:
+            _insert(engine, models.FeatureFlag.__table__, flag_rows)
+            flag_rows = []
+    _insert(engine, models.FeatureFlag.__table__, flag_rows)
+
+    if engine.dialect.name == "postgresql":
+        # Explicit ids leave the serial sequences behind
+        with engine.begin() as connection:
+            for table in ("users", "projects", "feature_flags"):
+                connection.execute(text(
+                    f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), (SELECT max(id) FROM {table}))"
+                ))
+    return {"projects": projects, "flags": flags, "users": users}
@@ -0,0 +1,144 @@
+"""Per-row cost of the list endpoints' response serialization.
+
+Times the ways of turning a page of flags into a response body, outside the
+HTTP stack so the per-row cost isn't hidden behind routing and auth:
+
+- ``orm``: ORM instances validated against ``response_model`` and encoded by
+  FastAPI's ``jsonable_encoder`` and ``JSONResponse``, as before the fast path;
+- ``rows``: the schema's columns selected as dicts and encoded by orjson
+  (``app.serialization.rows_response``), as the list endpoints do now;
+- ``rows_debug``: the same with ``DEBUG=true``, which validates every row.
+
+Each is reported as microseconds per row: the query, timed on its own, and the
+encoding, timed on the same pages fetched beforehand for every path.
+
+    python -m benchmarks.serialization --flags 20000 --page-size 100 --page-size 1000
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from typing import Awaitable, Callable, Dict, List
+
+from .run import percentile
+
+# Distinct pages the encoders cycle through
+PAGES = 20
+
+
+async def _time(operation: Callable[[int], Awaitable[None]], iterations: int, warmup: int) -> float:
+    # Median seconds per call
+    for i in range(warmup):
+        await operation(i)
+    latencies = []
+    for i in range(iterations):
+        before = time.perf_counter()
+        await operation(i)
+        latencies.append(time.perf_counter() - before)
+    latencies.sort()
+    return percentile(latencies, 0.50)
+
+
+async def _run(args) -> Dict[str, Dict[str, float]]:
+    from fastapi import Response
+    from fastapi.responses import JSONResponse
+    from fastapi.routing import serialize_response
+    from fastapi.utils import create_response_field
+    from app import async_crud, schemas
+    from app.config import settings
+    from app.database import AsyncSessionLocal
+    from app.serialization import rows_response
+
+    rng = random.Random(args.seed)
+    field = create_response_field(name="response", type_=List[schemas.FeatureFlag])
+    results = {}
+    async with AsyncSessionLocal() as db:
+        for page_size in args.page_size:
+            def after_id(i: int) -> int:
+                return rng.randint(0, max(0, args.flags - page_size))
+
+            async def orm_query(i: int):
+                await async_crud.get_feature_flags(db, limit=page_size, after_id=after_id(i))
+                db.expunge_all()
+
+            async def rows_query(i: int):
+                await async_crud.get_feature_flag_rows(db, limit=page_size, after_id=after_id(i))
+
+            # Serialization is timed on pages fetched up front, so the query's noise stays out of it
+            starts = [after_id(i) for i in range(PAGES)]
+            orm_pages = [await async_crud.get_feature_flags(db, limit=page_size, after_id=start) for start in starts]
+            row_pages = [await async_crud.get_feature_flag_rows(db, limit=page_size, after_id=start)
+                         for start in starts]
+
+            async def orm(i: int):
+                content = await serialize_response(field=field, response_content=orm_pages[i % PAGES])
+                JSONResponse(content).body
+
+            async def rows(i: int):
+                rows_response(row_pages[i % PAGES], schemas.FeatureFlag, Response()).body
+
+            # Both paths must produce the same document
+            expected = JSONResponse(await serialize_response(field=field, response_content=orm_pages[0])).body
+            actual = rows_response(row_pages[0], schemas.FeatureFlag, Response()).body
+            if json.loads(expected) != json.loads(actual):
+                raise SystemExit("the fast path's output differs from response_model's")
+
+            timings = {}
+            for name, operation in (("orm_query", orm_query), ("orm", orm),
+                                    ("rows_query", rows_query), ("rows", rows)):
+                timings[name] = await _time(operation, args.iterations, args.warmup)
+            settings.debug = True
+            try:
+                timings["rows_debug"] = await _time(rows, args.iterations, args.warmup)
+            finally:
+                settings.debug = False
+            db.expunge_all()
+            results[str(page_size)] = {name: seconds * 1e6 / page_size for name, seconds in timings.items()}
+    return results
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--flags", type=int, default=20000)
+    parser.add_argument("--page-size", type=int, action="append", default=[])
+    parser.add_argument("--iterations", type=int, default=100)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--database-url", help="Defaults to a fresh SQLite file in a temporary directory")
+    parser.add_argument("--reuse", action="store_true", help="Skip seeding if the database is already seeded")
+    return parser.parse_args()
+
+
+def main() -> int:
+    args = parse_args()
+    args.page_size = args.page_size or [100, 1000]
+    database_url = args.database_url or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.sqlite')}"
+    # Settings are read on import, so the app must be imported after this
+    os.environ["DATABASE_URL"] = database_url
+    os.environ.pop("ASYNC_DATABASE_URL", None)
+    os.environ["DEBUG"] = "false"
+
+    from app.database import engine
+    from . import seed
+
+    if not (args.reuse and seed.is_seeded(engine)):
+        seed.seed(engine, max(1, args.flags // 100), args.flags, 10, seed=args.seed)
+
+    results = asyncio.run(_run(args))
+    print(f"{'us per row':<12}{'orm query':>12}{'rows query':>12}{'orm encode':>12}{'rows encode':>12}"
+          f"{'rows debug':>12}{'speedup':>10}")
+    for page_size, timings in results.items():
+        # Both encode columns time real work on the same pages, so the ratio is well defined
+        speedup = timings["orm"] / timings["rows"]
+        print(f"{page_size + ' rows':<12}{timings['orm_query']:>12.2f}{timings['rows_query']:>12.2f}"
+              f"{timings['orm']:>12.2f}{timings['rows']:>12.2f}{timings['rows_debug']:>12.2f}"
+              f"{speedup:>9.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
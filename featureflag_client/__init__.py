@@ -0,0 +1,8 @@
+"""Python client for the Feature Flag API with local, in-memory evaluation."""
+from .client import FeatureFlagClient, FeatureFlagError
+from .evaluation import User
+from .snapshot import SnapshotError, SnapshotFile, write_snapshot
+
+__all__ = [
+    "FeatureFlagClient", "FeatureFlagError", "SnapshotError", "SnapshotFile", "User", "write_snapshot",
+]
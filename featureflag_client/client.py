@@ -0,0 +1,265 @@
+import json
+import logging
+import threading
+import time
+from typing import Any, Dict, Iterator, Optional, Tuple
+import requests
+from requests.adapters import HTTPAdapter
+from .evaluation import ANONYMOUS, CompiledFlag, User, compile_flag, compile_flags
+from .snapshot import SnapshotError, SnapshotFile
+
+logger = logging.getLogger(__name__)
+
+
+class FeatureFlagError(Exception):
+    pass
+
+
+class FeatureFlagClient:
+    """Keeps one project/environment's flags in memory and evaluates them locally.
+
+    Flags are fetched once on ``start()`` and then refreshed by a background
+    thread, either by polling the project snapshot with ``If-None-Match`` or by
+    following the server-sent event stream (``stream=True``, falling back to
+    polling while the stream is down). ``is_enabled`` never touches the network:
+    it reads an immutable dict that refreshes swap out whole, so checks need no
+    lock. When a refresh fails the last flags that loaded successfully stay in use;
+    if the very first load fails, flags come from ``snapshot_path`` when given.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        project_id: int,
+        environment: str,
+        username: Optional[str] = None,
+        password: Optional[str] = None,
+        token: Optional[str] = None,
+        refresh_interval: float = 30.0,
+        stream: bool = False,
+        timeout: float = 10.0,
+        pool_size: int = 4,
+        snapshot_path: Optional[str] = None,
+    ):
+        if token is None and (username is None or password is None):
+            raise ValueError("Pass either a token or a username and password")
+        self.base_url = base_url.rstrip("/")
+        self.project_id = project_id
+        self.environment = environment
+        self.refresh_interval = refresh_interval
+        self.stream = stream
+        self.timeout = timeout
+        self.snapshot_path = snapshot_path
+        self.last_error: Optional[BaseException] = None
+        self.last_refreshed: Optional[float] = None
+        self._username = username
+        self._password = password
+        self._token = token
+        self._flags: Dict[str, CompiledFlag] = {}
+        self._flag_names: Dict[int, str] = {}
+        self._etag: Optional[str] = None
+        self._ready = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._stream_response: Optional[requests.Response] = None
+        self._backoff = 1.0
+
+        # One keep-alive pool for the token, snapshot and stream requests
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+
+    # Evaluation
+    def is_enabled(self, flag: str, user: User = ANONYMOUS, default: bool = False) -> bool:
+        compiled = self._flags.get(flag)
+        if compiled is None:
+            return default
+        return compiled.matches(user)
+
+    def all_flags(self, user: User = ANONYMOUS) -> Dict[str, bool]:
+        return {name: compiled.matches(user) for name, compiled in self._flags.items()}
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+    def wait_until_ready(self, timeout: Optional[float] = None) -> bool:
+        return self._ready.wait(timeout)
+
+    # Lifecycle
+    def start(self) -> "FeatureFlagClient":
+        if self._thread is not None and self._thread.is_alive():
+            return self
+        self._stopped.clear()
+        try:
+            self.refresh()
+        except Exception as exc:
+            # Keep going; the background thread retries until the first load succeeds
+            logger.warning("Initial flag load failed: %s", exc)
+            if self.snapshot_path is not None:
+                self._load_snapshot_file()
+            self.last_error = exc
+        self._thread = threading.Thread(target=self._run, name="featureflag-refresh", daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self):
+        self._stopped.set()
+        response = self._stream_response
+        if response is not None:
+            # Unblocks a stream read
+            response.close()
+        if self._thread is not None:
+            self._thread.join(timeout=self.timeout)
+            self._thread = None
+        self._session.close()
+
+    def __enter__(self) -> "FeatureFlagClient":
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    # HTTP
+    def _authenticate(self):
+        if self._username is None:
+            raise FeatureFlagError("Token rejected and no credentials to renew it")
+        response = self._session.post(
+            f"{self.base_url}/auth/token",
+            data={"username": self._username, "password": self._password},
+            timeout=self.timeout,
+        )
+        if response.status_code != 200:
+            raise FeatureFlagError(f"Authentication failed with {response.status_code}: {response.text}")
+        self._token = response.json()["access_token"]
+
+    def _get(self, path: str, headers: Optional[Dict[str, str]] = None, **kwargs) -> requests.Response:
+        if self._token is None:
+            self._authenticate()
+        for attempt in range(2):
+            response = self._session.get(
+                f"{self.base_url}{path}",
+                params={"environment": self.environment},
+                headers={**(headers or {}), "Authorization": f"Bearer {self._token}"},
+                **kwargs,
+            )
+            # Tokens expire; renew once and retry
+            if response.status_code == 401 and attempt == 0:
+                response.close()
+                self._authenticate()
+                continue
+            return response
+        return response
+
+    def _set_flags(self, flags):
+        self._flags = compile_flags(flags)
+        self._flag_names = {flag["id"]: flag["name"] for flag in flags}
+        self.last_refreshed = time.time()
+        self.last_error = None
+        self._ready.set()
+
+    def _load_snapshot_file(self):
+        try:
+            with SnapshotFile(self.snapshot_path) as snapshot:
+                self._set_flags([record._asdict() for record in snapshot.flags(self.project_id, self.environment)])
+                self.last_refreshed = snapshot.generated_at
+        except (OSError, SnapshotError) as exc:
+            logger.warning("Could not load flags from %s: %s", self.snapshot_path, exc)
+
+    # Polling
+    def refresh(self) -> bool:
+        """Fetch the snapshot unless it is unchanged; returns whether flags were replaced."""
+        headers = {"If-None-Match": self._etag} if self._etag else {}
+        response = self._get(f"/projects/{self.project_id}/snapshot", headers=headers, timeout=self.timeout)
+        if response.status_code == 304:
+            self.last_refreshed = time.time()
+            self.last_error = None
+            return False
+        if response.status_code != 200:
+            raise FeatureFlagError(f"Snapshot request failed with {response.status_code}: {response.text}")
+        self._set_flags(response.json()["flags"])
+        self._etag = response.headers.get("ETag")
+        return True
+
+    # Streaming
+    def _events(self, response: requests.Response) -> Iterator[Tuple[str, Any]]:
+        event, data = None, []
+        for line in response.iter_lines(decode_unicode=True):
+            if line is None:
+                continue
+            if not line:
+                if event is not None and data:
+                    yield event, json.loads("\n".join(data))
+                event, data = None, []
+            elif line.startswith("event:"):
+                event = line[6:].strip()
+            elif line.startswith("data:"):
+                data.append(line[5:].strip())
+
+    def _apply_event(self, event: str, payload: Dict[str, Any]):
+        if event == "snapshot":
+            self._set_flags(payload["flags"])
+            return
+        if event == "project_deleted":
+            self._set_flags([])
+            return
+        flag = payload.get("flag")
+        if flag is None:
+            return
+        # Copy-on-write so readers always see a complete dict
+        flags = dict(self._flags)
+        flag_names = dict(self._flag_names)
+        previous_name = flag_names.pop(flag["id"], None)
+        if previous_name is not None:
+            flags.pop(previous_name, None)
+        if event in ("created", "updated"):
+            flags[flag["name"]] = compile_flag(flag)
+            flag_names[flag["id"]] = flag["name"]
+        self._flags = flags
+        self._flag_names = flag_names
+        self.last_refreshed = time.time()
+
+    def _follow_stream(self):
+        # The server sends a keep-alive every 15s by default, so a much longer silence means a dead connection
+        response = self._get(
+            f"/feature-flags/project/{self.project_id}/stream",
+            stream=True,
+            timeout=(self.timeout, max(60.0, self.refresh_interval)),
+        )
+        if response.status_code != 200:
+            raise FeatureFlagError(f"Stream request failed with {response.status_code}: {response.text}")
+        self._stream_response = response
+        self._backoff = 1.0
+        try:
+            for event, payload in self._events(response):
+                self._apply_event(event, payload)
+        finally:
+            self._stream_response = None
+            response.close()
+        if not self._stopped.is_set():
+            raise FeatureFlagError("Stream closed by the server")
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                if self.stream:
+                    self._follow_stream()
+                else:
+                    self.refresh()
+            except Exception as exc:
+                if self._stopped.is_set():
+                    return
+                self.last_error = exc
+                logger.warning("Flag refresh failed, keeping last known flags: %s", exc)
+                if self.stream:
+                    # Poll while the stream is down so flags don't go stale meanwhile
+                    try:
+                        self.refresh()
+                    except Exception:
+                        pass
+                    self._stopped.wait(self._backoff)
+                    self._backoff = min(self._backoff * 2, self.refresh_interval)
+                    continue
+            if not self.stream:
+                self._stopped.wait(self.refresh_interval)
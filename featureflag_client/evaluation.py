@@ -0,0 +1,131 @@
+"""Local flag evaluation, matching the server's semantics in app/evaluation.py.
+
+Kept free of server imports so the client only needs ``requests``.
+"""
+import math
+from bisect import bisect_right
+from hashlib import blake2b
+from typing import Any, Dict, Iterable, Mapping, NamedTuple, Optional, Tuple
+
+ROLLOUT_BUCKETS = 10000
+_MASK64 = (1 << 64) - 1
+
+
+def stable_hash(value: str) -> int:
+    return int.from_bytes(blake2b(value.encode(), digest_size=8).digest(), "little")
+
+
+def rollout_bucket(flag_hash: int, user_hash: int) -> int:
+    z = flag_hash ^ user_hash
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & _MASK64
+    return (z ^ (z >> 31)) % ROLLOUT_BUCKETS
+
+
+class User:
+    """Evaluation context; build it once per request and reuse it for every check."""
+
+    __slots__ = ("user_id", "groups", "attributes", "user_hash")
+
+    def __init__(self, user_id: Optional[str] = None, groups: Iterable[str] = (),
+                 attributes: Optional[Mapping[str, Any]] = None):
+        self.user_id = user_id
+        self.groups = frozenset(groups)
+        self.attributes = attributes or {}
+        self.user_hash = stable_hash(str(user_id)) if user_id is not None else None
+
+
+ANONYMOUS = User()
+
+
+class _Groups(NamedTuple):
+    groups: frozenset
+
+    def matches(self, user: User) -> bool:
+        return not self.groups.isdisjoint(user.groups)
+
+
+class _Values(NamedTuple):
+    attribute: str
+    values: frozenset
+
+    def matches(self, user: User) -> bool:
+        try:
+            return user.attributes.get(self.attribute) in self.values
+        except TypeError:
+            return False
+
+
+class _Ranges(NamedTuple):
+    attribute: str
+    starts: Tuple[float, ...]
+    ends: Tuple[float, ...]
+
+    def matches(self, user: User) -> bool:
+        value = user.attributes.get(self.attribute)
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            return False
+        index = bisect_right(self.starts, value) - 1
+        return index >= 0 and value < self.ends[index]
+
+
+class _Rollout(NamedTuple):
+    flag_hash: int
+    threshold: int
+
+    def matches(self, user: User) -> bool:
+        return user.user_hash is not None and rollout_bucket(self.flag_hash, user.user_hash) < self.threshold
+
+
+def _merge_ranges(ranges) -> Tuple[Tuple[float, ...], Tuple[float, ...]]:
+    intervals = sorted(
+        (-math.inf if low is None else low, math.inf if high is None else high) for low, high in ranges
+    )
+    starts, ends = [], []
+    for low, high in intervals:
+        if ends and low <= ends[-1]:
+            ends[-1] = max(ends[-1], high)
+        else:
+            starts.append(low)
+            ends.append(high)
+    return tuple(starts), tuple(ends)
+
+
+def _compile_rule(rule: Mapping[str, Any], flag_name: str):
+    kind = rule.get("type")
+    if kind == "group":
+        return _Groups(frozenset(rule["groups"]))
+    if kind == "attribute":
+        return _Values(rule["attribute"], frozenset(rule["values"]))
+    if kind == "range":
+        return _Ranges(rule["attribute"], *_merge_ranges(rule["ranges"]))
+    if kind == "rollout":
+        return _Rollout(stable_hash(flag_name), round(rule["percentage"] * ROLLOUT_BUCKETS / 100))
+    raise ValueError(f"Unknown targeting rule type {kind!r}")
+
+
+class CompiledFlag(NamedTuple):
+    name: str
+    is_enabled: bool
+    # None means untargeted
+    rules: Optional[Tuple[Any, ...]]
+
+    def matches(self, user: User) -> bool:
+        if not self.is_enabled:
+            return False
+        if self.rules is None:
+            return True
+        for rule in self.rules:
+            if not rule.matches(user):
+                return False
+        return True
+
+
+def compile_flag(flag: Mapping[str, Any]) -> CompiledFlag:
+    targeting = flag.get("user_group_targeting") or {}
+    rules = tuple(_compile_rule(rule, flag["name"]) for rule in targeting.get("rules") or ())
+    return CompiledFlag(flag["name"], bool(flag.get("is_enabled")), rules or None)
+
+
+def compile_flags(flags: Iterable[Mapping[str, Any]]) -> Dict[str, CompiledFlag]:
+    return {flag["name"]: compile_flag(flag) for flag in flags}
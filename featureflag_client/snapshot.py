@@ -0,0 +1,192 @@
+"""Read-only binary flag snapshots for running without the API.
+
+``python -m app.snapshot_export`` writes every flag into one file laid out as a
+header, a sorted fixed-width index, a key blob and a value blob. Readers mmap
+the file and binary-search the index in place, so opening costs no parsing and
+every process on a host shares the same page-cached copy.
+
+Keys are the big-endian project id, the environment, a NUL and the flag name,
+so byte order groups a project environment's flags together.
+"""
+import json
+import mmap
+import os
+import struct
+import tempfile
+import time
+import zlib
+from bisect import bisect_left
+from typing import Any, Dict, Iterable, Iterator, Mapping, NamedTuple, Optional
+from .evaluation import CompiledFlag, compile_flag
+
+MAGIC = b"FFSNAP\x00\x00"
+FORMAT_VERSION = 1
+
+# magic, format version, flag count, generated at, index/keys/values offsets, CRC32 of the body
+HEADER = struct.Struct("<8sII d QQQ I 4x")
+# key offset, key length, value offset, value length
+ENTRY = struct.Struct("<IIII")
+# flag id, is_enabled; the targeting JSON follows
+VALUE = struct.Struct("<QB")
+PROJECT_ID = struct.Struct(">Q")
+
+
+class SnapshotError(Exception):
+    pass
+
+
+class FlagRecord(NamedTuple):
+    id: int
+    project_id: int
+    environment: str
+    name: str
+    is_enabled: bool
+    user_group_targeting: Optional[Dict[str, Any]]
+
+
+def _scope_prefix(project_id: int, environment: str) -> bytes:
+    return PROJECT_ID.pack(project_id) + environment.encode() + b"\x00"
+
+
+def _key(project_id: int, environment: str, name: str) -> bytes:
+    return _scope_prefix(project_id, environment) + name.encode()
+
+
+def write_snapshot(path: str, flags: Iterable[Mapping[str, Any]]) -> int:
+    """Write ``flags`` (dicts shaped like the API's flags) to ``path``; returns the flag count.
+
+    The file is written next to ``path`` and renamed over it, so readers that
+    still have the old file mapped keep a consistent copy.
+    """
+    entries = []
+    for flag in flags:
+        targeting = flag.get("user_group_targeting")
+        value = VALUE.pack(flag["id"], bool(flag["is_enabled"]))
+        if targeting:
+            value += json.dumps(targeting, separators=(",", ":")).encode()
+        entries.append((_key(flag["project_id"], flag["environment"], flag["name"]), value))
+    entries.sort()
+
+    index, keys, values = bytearray(), bytearray(), bytearray()
+    for key, value in entries:
+        index += ENTRY.pack(len(keys), len(key), len(values), len(value))
+        keys += key
+        values += value
+    index_offset = HEADER.size
+    keys_offset = index_offset + len(index)
+    values_offset = keys_offset + len(keys)
+    body = bytes(index + keys + values)
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, len(entries), time.time(),
+                         index_offset, keys_offset, values_offset, zlib.crc32(body))
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".snapshot-")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            out.write(header)
+            out.write(body)
+            out.flush()
+            os.fsync(out.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return len(entries)
+
+
+class _Keys:
+    # Sequence view over the index so bisect can search the mapped file directly
+    __slots__ = ("_snapshot",)
+
+    def __init__(self, snapshot: "SnapshotFile"):
+        self._snapshot = snapshot
+
+    def __len__(self) -> int:
+        return self._snapshot.count
+
+    def __getitem__(self, position: int) -> bytes:
+        return self._snapshot._key_at(position)
+
+
+class SnapshotFile:
+    """Memory-mapped reader for a file written by ``write_snapshot``.
+
+    Only the pages touched by a lookup are read from disk. Pass ``verify=True``
+    to check the CRC on open, which reads the whole file once.
+    """
+
+    def __init__(self, path: str, verify: bool = False):
+        self.path = path
+        with open(path, "rb") as file:
+            # mmap refuses empty files, which an interrupted copy can leave behind
+            if os.fstat(file.fileno()).st_size == 0:
+                raise SnapshotError(f"{path} is empty")
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self._read_header(verify)
+        except Exception:
+            self._mmap.close()
+            raise
+        self._keys = _Keys(self)
+
+    def _read_header(self, verify: bool):
+        if len(self._mmap) < HEADER.size:
+            raise SnapshotError(f"{self.path} is too short to be a flag snapshot")
+        (magic, format_version, self.count, self.generated_at, self._index_offset,
+         self._keys_offset, self._values_offset, checksum) = HEADER.unpack_from(self._mmap)
+        if magic != MAGIC:
+            raise SnapshotError(f"{self.path} is not a flag snapshot")
+        if format_version != FORMAT_VERSION:
+            raise SnapshotError(f"Unsupported snapshot format {format_version}")
+        if self._index_offset + self.count * ENTRY.size > len(self._mmap):
+            raise SnapshotError(f"{self.path} is truncated")
+        if verify and zlib.crc32(memoryview(self._mmap)[HEADER.size:]) != checksum:
+            raise SnapshotError(f"{self.path} failed its checksum")
+
+    def _entry(self, position: int):
+        return ENTRY.unpack_from(self._mmap, self._index_offset + position * ENTRY.size)
+
+    def _key_at(self, position: int) -> bytes:
+        key_offset, key_length, _, _ = self._entry(position)
+        start = self._keys_offset + key_offset
+        return self._mmap[start:start + key_length]
+
+    def _record(self, position: int, key: bytes) -> FlagRecord:
+        _, _, value_offset, value_length = self._entry(position)
+        start = self._values_offset + value_offset
+        flag_id, is_enabled = VALUE.unpack_from(self._mmap, start)
+        targeting = None
+        if value_length > VALUE.size:
+            targeting = json.loads(self._mmap[start + VALUE.size:start + value_length])
+        environment, _, name = key[PROJECT_ID.size:].partition(b"\x00")
+        return FlagRecord(flag_id, PROJECT_ID.unpack_from(key)[0], environment.decode(),
+                          name.decode(), bool(is_enabled), targeting)
+
+    def get(self, project_id: int, environment: str, name: str) -> Optional[FlagRecord]:
+        key = _key(project_id, environment, name)
+        position = bisect_left(self._keys, key)
+        if position < self.count and self._key_at(position) == key:
+            return self._record(position, key)
+        return None
+
+    def flags(self, project_id: int, environment: str) -> Iterator[FlagRecord]:
+        prefix = _scope_prefix(project_id, environment)
+        position = bisect_left(self._keys, prefix)
+        while position < self.count:
+            key = self._key_at(position)
+            if not key.startswith(prefix):
+                break
+            yield self._record(position, key)
+            position += 1
+
+    def compile(self, project_id: int, environment: str) -> Dict[str, CompiledFlag]:
+        return {record.name: compile_flag(record._asdict()) for record in self.flags(project_id, environment)}
+
+    def close(self):
+        self._mmap.close()
+
+    def __enter__(self) -> "SnapshotFile":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
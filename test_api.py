@@ -129,7 +129,24 @@ def test_api():
         print(f"   Role: {user['role']}")
     else:
         print(f"❌ Failed to get user info: {response.text}")
-    
+
+    # 8. Evaluate flags for a user
+    print("\n8. Evaluating flags for a beta user...")
+    evaluate_data = {
+        "project_id": project_id,
+        "environment": "dev",
+        "user": {"user_id": "42", "groups": ["beta_users"]}
+    }
+
+    response = requests.post(f"{BASE_URL}/evaluate", json=evaluate_data, headers=headers)
+    if response.status_code == 200:
+        result = response.json()
+        print("✅ Flags evaluated")
+        for name, enabled in result["flags"].items():
+            print(f"   - {name}: {enabled}")
+    else:
+        print(f"❌ Failed to evaluate flags: {response.text}")
+
     print("\n🎉 API test completed successfully!")
     print(f"\n📚 API Documentation: http://localhost:8000/docs")
     print(f"🔗 ReDoc: http://localhost:8000/redoc")